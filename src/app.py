@@ -14,39 +14,41 @@ if os.getenv('TH_DEPLOY'):
 load_dotenv()
 
 from components import navbar, footer
-from utils import cache
+from utils import cache, import_profile, metrics, profiling, responses
 
 dbc_css = ("https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates@V1.0.2/dbc.min.css")
 html2canvas = {'src': 'https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js'}
 
 launch_uid = uuid.uuid4()
 
-app = dash.Dash(
-    __name__,
-    use_pages=True,
-    external_stylesheets=[
-        dbc_css,
-        'https://use.fontawesome.com/releases/v6.7.2/css/all.css',
-        'https://epsi95.github.io/dash-draggable-css-scipt/dragula.css'
-    ],
-    external_scripts=[
-        html2canvas,
-        'https://cdnjs.cloudflare.com/ajax/libs/dragula/3.7.2/dragula.min.js',
-        'https://epsi95.github.io/dash-draggable-css-scipt/script.js'
-    ],
-    meta_tags=[
-        {
-            'name': 'viewport',
-            'content': 'width=device-width, initial-scale=1'
-        },
-        {
-            'name': 'google-adsense-account',
-            'content': 'ca-pub-1461880207794875'
-        }
-    ],
-    suppress_callback_exceptions=True,
-    title='Trainer Hill',
-)
+# importing the pages happens while the app is created
+with import_profile.profile_imports(enabled=bool(os.getenv('TH_IMPORT_REPORT'))):
+    app = dash.Dash(
+        __name__,
+        use_pages=True,
+        external_stylesheets=[
+            dbc_css,
+            'https://use.fontawesome.com/releases/v6.7.2/css/all.css',
+            'https://epsi95.github.io/dash-draggable-css-scipt/dragula.css'
+        ],
+        external_scripts=[
+            html2canvas,
+            'https://cdnjs.cloudflare.com/ajax/libs/dragula/3.7.2/dragula.min.js',
+            'https://epsi95.github.io/dash-draggable-css-scipt/script.js'
+        ],
+        meta_tags=[
+            {
+                'name': 'viewport',
+                'content': 'width=device-width, initial-scale=1'
+            },
+            {
+                'name': 'google-adsense-account',
+                'content': 'ca-pub-1461880207794875'
+            }
+        ],
+        suppress_callback_exceptions=True,
+        title='Trainer Hill',
+    )
 cache.cache.init_app(app.server)
 
 app.index_string = '''
@@ -93,6 +95,9 @@ def serve_layout():
 
 app.layout = serve_layout
 server = app.server
+responses.init_app(server)
+metrics.init_app(server)
+profiling.init_app(server)
 
 
 @server.route('/ads.txt')
@@ -129,6 +129,16 @@ window.dash_clientside.clientside = {
         return [{}, {}, 'tour-meta-report-upload-tab', ''];
     },
 
+    set_tour_report_deck: function(values, roster) {
+        const triggered = window.dash_clientside.callback_context.triggered;
+        // a freshly rendered roster table triggers every dropdown at once
+        if (triggered.length !== 1 || !triggered[0].prop_id.endsWith('.value')) {
+            return window.dash_clientside.no_update;
+        }
+        const id = JSON.parse(triggered[0].prop_id.slice(0, -'.value'.length));
+        return Object.assign({}, roster, {[id.index]: triggered[0].value});
+    },
+
     show_hide_all_items: function(toggle, currentItems) {
         if (toggle) {
             return Array(currentItems.length).fill('');
@@ -0,0 +1,125 @@
+"""Compare the streaming TDF reader against the old ElementTree to dict
+conversion on synthetic events.
+
+    python -m benchmarks.tdf_parse --players 2000 --rounds 18
+"""
+import argparse
+import base64
+import collections
+import random
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from utils import tdf
+
+
+def make_tdf(players, rounds, seed=0):
+    rng = random.Random(seed)
+    ids = [str(1_000_000 + i) for i in range(players)]
+    out = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<tournament type="2" stage="5" version="1.80" gametype="TRADING_CARD_GAME" mode="TCG1DAY">',
+        '<data><name>Synthetic Regional</name><id>00-00-000000</id><city>City</city><state>ST</state>'
+        '<country>Country</country><roundtime>50</roundtime><finalsroundtime>75</finalsroundtime>'
+        '<organizer popid="1" name="Organizer"/><startdate>01/01/2025</startdate><lessswiss>false</lessswiss>'
+        '<autotablenumber>true</autotablenumber><overflowtablestart>0</overflowtablestart></data>',
+        '<timeelapsed>0</timeelapsed><players>',
+    ]
+    for i, pid in enumerate(ids):
+        out.append(
+            f'<player userid="{pid}"><firstname>First{i}</firstname><lastname>Last{i}</lastname>'
+            f'<birthdate>01/01/2000</birthdate><creationdate>01/01/2025 09:00:00</creationdate>'
+            f'<lastmodifieddate>01/01/2025 09:00:00</lastmodifieddate></player>'
+        )
+    out.append('</players><pods><pod category="2" stage="5"><subgroups/><rounds>')
+    points = collections.Counter()
+    for r in range(1, rounds + 1):
+        out.append(f'<round number="{r}" type="3" stage="5"><timeleft>0</timeleft><matches>')
+        order = sorted(ids, key=lambda p: (-points[p], rng.random()))
+        table = 1
+        for a, b in zip(order[::2], order[1::2]):
+            outcome = rng.choice((1, 1, 2, 2, 3))
+            points[a] += 3 if outcome == 1 else 1 if outcome == 3 else 0
+            points[b] += 3 if outcome == 2 else 1 if outcome == 3 else 0
+            out.append(
+                f'<match outcome="{outcome}"><player1 userid="{a}"/><player2 userid="{b}"/>'
+                f'<timestamp>01/01/2025 10:00:00</timestamp><tablenumber>{table}</tablenumber></match>'
+            )
+            table += 1
+        if len(order) % 2:
+            points[order[-1]] += 3
+            out.append(f'<match outcome="5"><player userid="{order[-1]}"/><timestamp>01/01/2025 10:00:00</timestamp></match>')
+        out.append('</matches></round>')
+    out.append('</rounds></pod></pods><standings><pod category="2" type="finished">')
+    ranked = sorted(ids, key=lambda p: -points[p])
+    # the bottom two dropped
+    for place, pid in enumerate(ranked[:-2], 1):
+        out.append(f'<player id="{pid}" place="{place}"/>')
+    out.append('</pod><pod category="2" type="dnf">')
+    for place, pid in enumerate(ranked[-2:], len(ranked) - 1):
+        out.append(f'<player id="{pid}" place="{place}"/>')
+    out.append('</pod></standings></tournament>')
+    return '\n'.join(out).encode()
+
+
+# the conversion the Tournament Meta Report used before `utils.tdf`
+def _etree_to_dict(t):
+    d = {t.tag: {} if t.attrib else None}
+    children = list(t)
+    if children:
+        dd = collections.defaultdict(list)
+        for dc in map(_etree_to_dict, children):
+            for k, v in dc.items():
+                dd[k].append(v)
+        d = {t.tag: {k: v[0] if len(v) == 1 else v for k, v in dd.items()}}
+    if t.attrib:
+        d[t.tag].update(('@' + k, v) for k, v in t.attrib.items())
+    if t.text:
+        text = t.text.strip()
+        if children or t.attrib:
+            if text:
+                d[t.tag]['#text'] = text
+        else:
+            d[t.tag] = text
+    return d
+
+
+def legacy_parse(raw):
+    return _etree_to_dict(ET.fromstring(raw))
+
+
+def measure(fn, raw, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(raw)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=18)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    raw = make_tdf(args.players, args.rounds)
+    # uploads arrive base64 encoded, decoding is the same for both readers
+    encoded = base64.b64encode(raw)
+    print(f'{args.players} players, {args.rounds} rounds, {len(raw) / 1e6:.1f}MB ({len(encoded) / 1e6:.1f}MB encoded)')
+
+    t = tdf.parse(raw)
+    print(f'{len(t.players)} players, {len(t.rounds)} rounds, {len(t.matches)} matches, {len(t.standings)} standings')
+    for name, fn in [('etree_to_dict', legacy_parse), ('tdf.parse', tdf.parse)]:
+        seconds, peak = measure(fn, raw, args.repeat)
+        print(f'{name:>14}: {seconds * 1000:8.0f}ms  peak {peak / 1e6:6.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 import dash
 from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Output, Input, State, MATCH, ALL, Patch, ctx
 import dash_bootstrap_components as dbc
-import random
 import uuid
 
 import components.deck_label
@@ -9,11 +8,14 @@ import utils.pokemon
 
 remove_tag = 'archetype_remove_tag_type'
 
-pokemon_options = [{
-    'label': components.deck_label.format_label(deck),
-    'value': deck['id'],
-    'search': deck['name']
-} for deck in utils.pokemon.pokemon_as_decks]
+
+def _icon_option(deck):
+    return {
+        'label': components.deck_label.format_label(deck),
+        'value': deck['id'],
+        'search': deck['name']
+    }
+
 
 class ArchetypeBuilderAIO(html.Div):
 
@@ -64,11 +66,10 @@ class ArchetypeBuilderAIO(html.Div):
         if other is None:
             other = []
 
-        random.shuffle(pokemon_options)
         component = [
             dbc.Form([
                 dbc.Label('Icons'),
-                dcc.Dropdown(id=self.ids.icons(aio_id), options=pokemon_options, multi=True, placeholder='Select Pokémon', value=[]),
+                dcc.Dropdown(id=self.ids.icons(aio_id), options=[], multi=True, placeholder='Search Pokémon', value=[]),
                 dbc.Label('Name'),
                 dbc.Input(type='text', value='', id=self.ids.name(aio_id), placeholder='Name the deck'),
                 dbc.FormText('Please select icons and input name.',id=self.ids.warning(aio_id), class_name='text-muted'),
@@ -79,6 +80,20 @@ class ArchetypeBuilderAIO(html.Div):
         ]
         super().__init__(component)
 
+    # Options are served as the user types instead of shipping all ~1,200
+    # icon labels with the page. Selected icons stay in the options so the
+    # dropdown can keep rendering them.
+    @callback(
+        Output(ids.icons(MATCH), 'options'),
+        Input(ids.icons(MATCH), 'search_value'),
+        State(ids.icons(MATCH), 'value')
+    )
+    def update_icon_options(search, value):
+        selected = [utils.pokemon.pokemon_by_id[i] for i in value or [] if i in utils.pokemon.pokemon_by_id]
+        matches = utils.pokemon.search(search or '')
+        decks = {d['id']: d for d in selected + matches}
+        return [_icon_option(d) for d in decks.values()]
+
     clientside_callback(
         ClientsideFunction(namespace='clientside', function_name='archetype_builder_disbaled_add'),
         Output(ids.add(MATCH), 'disabled'),
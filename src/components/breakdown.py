@@ -1,10 +1,17 @@
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 import dash_bootstrap_templates as dbt
-import plotly.express as px
 
+_templates_loaded = False
 
-dbt.load_figure_template(['flatly', 'darkly'])
+
+# plotly.express and the figure templates are slow to import, only pay for
+# them once a page actually draws a chart
+def _load_figure_templates():
+    global _templates_loaded
+    if not _templates_loaded:
+        dbt.load_figure_template(['flatly', 'darkly'])
+        _templates_loaded = True
 
 
 def create_deck_delta(d):
@@ -38,6 +45,9 @@ def create_ordered_list(l, placing=None, key='percent'):
 
 
 def create_pie_chart(l, theme):
+    import plotly.express as px
+
+    _load_figure_templates()
     fig = px.pie(
         values=[d['count'] for d in l],
         names=[d['name'] for d in l],
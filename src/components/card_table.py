@@ -1,64 +1,101 @@
-from dash import html, dcc
+from dash import html
 import dash_bootstrap_components as dbc
 import math
-import pandas as pd
-import plotly.express as px
+import numpy as np
+import urllib.parse
 
-from utils import colors, images
+from utils import colors, images, lru
 
 color_breakdown = colors.blue
 color_inclusion = colors.red
 color_winrate = colors.green
 
-def create_grid_item(card, total, game, allow_small=False):
+grid_item_cache = lru.LRUCache('card_grid_item', maxsize=2048)
+sprite_cache = lru.LRUCache('card_bar_sprite', maxsize=1024)
+
+# geometry of the bar sprite, the viewbox roughly matches the lower half of
+# a card image so the sprite fills its box without letterboxing
+SPRITE_WIDTH = 100
+SPRITE_HEIGHT = 70
+SPRITE_AXIS = 58
+# bars are drawn against a fixed 0 - 1.4 scale so all cards line up
+SPRITE_Y_MAX = 1.4
+
+
+# Count distributions for every card in one pass. Returns a dict of
+# card_code to (count, play_rate) pairs and the most played count.
+def compute_distributions(cards, total):
+    if len(cards) == 0:
+        return {}
+    max_count = max((c['count'] for card in cards for c in card.get('counts')), default=0)
+    decks = np.full((len(cards), max_count + 1), np.nan)
+    for i, card in enumerate(cards):
+        for c in card.get('counts'):
+            decks[i, c['count']] = c['decks']
+    rates = decks / total if total else np.full(decks.shape, np.nan)
+    rates[:, 0] = np.nan
+    present = ~np.isnan(rates)
+    max_nums = np.argmax(np.where(present, rates, -1), axis=1)
+
+    distributions = {}
+    for i, card in enumerate(cards):
+        counts = np.nonzero(present[i])[0]
+        bars = tuple((int(c), round(float(rates[i, c]), 3)) for c in counts)
+        distributions[card['card_code']] = (bars, int(max_nums[i]))
+    return distributions
+
+
+def _svg_bar_sprite(bars):
+    slot = SPRITE_WIDTH / max(len(bars), 1)
+    width = slot * 0.8
+    rects = []
+    labels = []
+    for i, (count, rate) in enumerate(bars):
+        height = min(rate / SPRITE_Y_MAX, 1) * SPRITE_AXIS
+        x = i * slot + (slot - width) / 2
+        rects.append(f"<rect x='{x:.1f}' y='{SPRITE_AXIS - height:.1f}' width='{width:.1f}' height='{height:.1f}'/>")
+        labels.append(f"<text x='{i * slot + slot / 2:.1f}' y='{SPRITE_HEIGHT - 2}'>{count}</text>")
+    svg = (
+        f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {SPRITE_WIDTH} {SPRITE_HEIGHT}'>"
+        f"<g fill='{color_breakdown}' stroke='black'>{''.join(rects)}</g>"
+        f"<g font-size='9' font-family='sans-serif' text-anchor='middle'>{''.join(labels)}</g>"
+        f"<path d='M0 {SPRITE_AXIS}H{SPRITE_WIDTH}' stroke='black'/>"
+        '</svg>'
+    )
+    # svg only needs the few characters that clash with a url escaped
+    return 'data:image/svg+xml,' + urllib.parse.quote(svg, safe=" '=/:.,-")
+
+
+# Sprites only depend on the distribution, so cards with the same spread
+# (e.g. every 4-of staple) share one data URI.
+def get_bar_sprite(bars):
+    sprite = sprite_cache.get(bars)
+    if sprite is None:
+        sprite = _svg_bar_sprite(bars)
+        sprite_cache.set(bars, sprite)
+    return sprite
+
+
+def _grid_item_key(card, total, game, allow_small=False, distribution=None):
+    counts = tuple((c['count'], c['decks']) for c in card.get('counts'))
+    return (card['card_code'], game, allow_small, total, card.get('play_rate'), counts)
+
+
+@lru.memoize(grid_item_cache, _grid_item_key)
+def create_grid_item(card, total, game, allow_small=False, distribution=None):
     id = card['card_code']
     play_rate = card.get('play_rate')
     if not play_rate:
         play_rate = sum(x['decks'] for x in card.get('counts')) / total
-
-    df = pd.DataFrame(
-        data={
-            'count': [c['count'] for c in card.get('counts')],
-            'play_rate': [c['decks']/total for c in card.get('counts')]
-        }
-    )
-    max_num = df.loc[df[df['count'] > 0].play_rate.idxmax(), 'count']
-    df = df[df['count'] > 0]
-    df.dropna(inplace=True)
-
-    figure = px.bar(
-        df, x='count', y='play_rate',
-        color_discrete_sequence=[color_breakdown],
-        labels=dict(count='', play_rate=''),
-    )
-    figure.update_traces(
-        marker_line_color='black',
-        marker_line_width=1
-    )
-    figure.update_layout(
-        plot_bgcolor='rgba(0, 0, 0, 0)',
-        paper_bgcolor='rgba(0, 0, 0, 0)',
-        margin=dict(l=0, r=0, b=0, t=0),
-    )
-    figure.update_xaxes(
-        showgrid=False,
-        title=None,
-        type='category',
-        linecolor='black'
-    )
-    figure.update_yaxes(
-        showticklabels=False,
-        title=None,
-        range=[0, 1.4],
-        showgrid=False
-    )
+    if distribution is None:
+        distribution = compute_distributions([card], total)[id]
+    bars, max_num = distribution
 
     item = dbc.Col([
         html.Img(src=images.get_card_image(id, 'SM', game), className='w-100'),
         html.Div(
-            dcc.Graph(
-                figure=figure,
-                config={'staticPlot': True},
+            html.Img(
+                src=get_bar_sprite(bars),
                 className='bg-white rounded h-100 w-100 bg-blur'
             ),
             className='position-absolute bottom-0 h-50 start-0 end-0 m-1'
@@ -72,7 +109,7 @@ def create_grid_item(card, total, game, allow_small=False):
             className='position-absolute bottom-40 p-2 w-100'
         ),
         dbc.Badge(
-            int(max_num),
+            max_num,
             class_name='position-absolute top-0 end-0 m-2 mt-3 rounded-circle font-monospace border border-light',
         )
     ], className='position-relative', id=id, xs=4, sm=3, md=2, lg=2, xl=1 if allow_small else 2)
@@ -80,11 +117,18 @@ def create_grid_item(card, total, game, allow_small=False):
 
 def create_grid_layout(cards, total, game):
     skeleton_count = sum(c['count'] for c in cards if c['skeleton'] if c['count'] > 0)
+    distributions = compute_distributions(cards, total)
     row = dbc.Row([
         html.H5(['Skeleton', dbc.Badge(skeleton_count, className='ms-1')]),
-        dbc.Row([create_grid_item(card, total, game) for card in cards if card['skeleton']], className='g-1 mb-1'),
+        dbc.Row([
+            create_grid_item(card, total, game, distribution=distributions[card['card_code']])
+            for card in cards if card['skeleton']
+        ], className='g-1 mb-1'),
         html.H5('Other cards'),
-        dbc.Row([create_grid_item(card, total, game) for card in cards if not card['skeleton']], className='g-1')
+        dbc.Row([
+            create_grid_item(card, total, game, distribution=distributions[card['card_code']])
+            for card in cards if not card['skeleton']
+        ], className='g-1')
     ])
     return row
 
@@ -1,7 +1,20 @@
 from dash import html
 
 import utils.images
+import utils.lru
 
+# labels only depend on the deck name, icons and flags, so the same tree is
+# shared across callbacks and users
+label_cache = utils.lru.LRUCache('deck_label', maxsize=4096)
+
+
+def _label_key(deck, hide_text=False, hide_text_small=False):
+    if deck is None:
+        return None
+    return (deck.get('name'), tuple(deck.get('icons', [])), hide_text, hide_text_small)
+
+
+@utils.lru.memoize(label_cache, _label_key)
 def format_label(deck, hide_text=False, hide_text_small=False):
     if deck is None:
         return ''
@@ -20,17 +20,17 @@ def create_deck_option(deck, icons, name):
     return opt
 
 
-@utils.cache.cache.memoize(43200)
+@utils.cache.memoize(43200)
 def _fetch_limitless_events():
     return th_helpers.scraper.limitless.fetch_events()
 
 
-@utils.cache.cache.memoize(86400)
+@utils.cache.memoize(86400)
 def _fetch_limitless_tour_decklists(tour):
     return th_helpers.scraper.limitless.fetch_decklists(tour)
 
 
-@utils.cache.cache.memoize(604800)
+@utils.cache.memoize(604800)
 def _fetch_limitless_decklist(url):
     limitless_decklist = th_helpers.scraper.limitless.fetch_decklist(url)
     decklist, _ = utils.decklists.parse_decklist(limitless_decklist)
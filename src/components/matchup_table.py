@@ -4,6 +4,7 @@ import math
 
 from components import deck_label
 from utils import colors
+import utils.matchups
 
 
 win_rate_calc_comp = dcc.Markdown(
@@ -106,35 +107,60 @@ def create_matchup_tile_row(deck, data, decks, player, against):
     ], className='mb-2')
     return row
 
-def create_matchup_spread(data, decks, player='deck1', against='deck2', small_view=False):
-    # Extract unique decks from player and sort them alphabetically
-    player_unique_decks = list(set(matchup[player] for matchup in data))
-    if len(player_unique_decks) == 0:
+def create_compact_tile(match, title):
+    if match is None or match['win_rate'] is None or math.isnan(match['win_rate']):
+        return html.Td('-', className='text-center align-middle')
+    wr = match['win_rate']
+    record = create_record_string(match)
+    return html.Td(
+        [f'{wr}%', html.Br(), record],
+        title=f'{title}\n{wr}%\n{record}',
+        style={'backgroundColor': colors.win_rate_color_bar[math.floor(wr)][1]},
+        className='text-center text-black align-middle matchup-compact-tile'
+    )
+
+# Plain table with the deck icons sent once in the headers, hover details
+# come from each cell's title instead of a Popover sub-tree per cell.
+def create_compact_spread(matrix, decks):
+    names = {
+        deck: decks.get(deck, deck_label.create_default_deck(deck))['name']
+        for deck in matrix['rows'] + matrix['columns']
+    }
+    headers = html.Thead(html.Tr([html.Th(win_rate_calc_comp)] + [
+        html.Th(deck_label.format_label(
+            decks.get(deck, deck_label.create_default_deck(deck)),
+            hide_text=True
+        )) for deck in matrix['columns']
+    ]), className='sticky-top')
+    rows = [
+        html.Tr([
+            html.Td(deck_label.format_label(decks.get(deck, deck_label.create_default_deck(deck))), className='text-nowrap align-middle')
+        ] + [
+            create_compact_tile(match, f'{names[deck]} vs. {names[other]}')
+            for match, other in zip(ordered_matchups, matrix['columns'])
+        ])
+        for deck, ordered_matchups in zip(matrix['rows'], matrix['cells'])
+    ]
+    return html.Div(dbc.Table([headers, html.Tbody(rows)], className='mb-0'), className='table-responsive')
+
+def create_matchup_spread(data, decks, player='deck1', against='deck2', small_view=False, compact=False):
+    matrix = utils.matchups.build_matrix(data, player, against)
+    return create_matrix_spread(matrix, decks, small_view, compact)
+
+def create_matrix_spread(matrix, decks, small_view=False, compact=False):
+    player = matrix['player']
+    against = matrix['against']
+    if len(matrix['rows']) == 0:
         return 'No matchup information found.'
-    if 'Plays:' in player_unique_decks[0]:
-        player_unique_decks = sorted(player_unique_decks, key=lambda x: int(x.split(':')[1].strip()))
-    else:
-        player_unique_decks = sorted(player_unique_decks)
-    against_unique_decks = sorted(set(matchup[against] for matchup in data))
+    if compact:
+        return create_compact_spread(matrix, decks)
 
     rows = []
     small_rows = []
-    # Organize the data
-    for deck in player_unique_decks:
+    for deck, ordered_matchups in zip(matrix['rows'], matrix['cells']):
         if deck not in decks:
             icons = ['substitute'] if 'Plays:' not in deck else []
             decks[deck] = {'id': deck, 'name': deck.title(), 'icons': icons}
-        matchups = sorted(
-            (matchup for matchup in data if matchup[player] == deck),
-            key=lambda x: x[against]
-        )
-        duplicates = [index for index, d in enumerate(matchups) if d[player] == d[against]]
-        if len(duplicates) > 1:
-            matchups.pop(duplicates[0])
-
-        ordered_matchups = [None for _ in range(len(against_unique_decks))]
-        for m in matchups:
-            ordered_matchups[against_unique_decks.index(m[against])] = m
         rows.append(create_matchup_table_row(deck, ordered_matchups, decks, player, against))
         small_rows.append(create_matchup_tile_row(deck, ordered_matchups, decks, player, against))
     
@@ -143,7 +169,7 @@ def create_matchup_spread(data, decks, player='deck1', against='deck2', small_vi
             decks.get(deck, deck_label.create_default_deck(deck)),
             hide_text=True
         ), className='d-flex justify-content-center')
-        for deck in against_unique_decks
+        for deck in matrix['columns']
     ]
     headers = html.Thead(html.Tr([
         html.Th(deck) for deck in [win_rate_calc_comp] + header_labels
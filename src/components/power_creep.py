@@ -1,12 +1,11 @@
 import os
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 
 import utils.colors
 
 # Load in Power creep data
 def _read_in_data():
+    import pandas as pd
+
     cwd = os.getcwd()
     data_in_path = os.path.join(cwd, 'assets', 'power_creep_data.csv')
     df = pd.read_csv(data_in_path)
@@ -20,6 +19,9 @@ def _read_in_data():
 
 
 def hp_by_stage_by_era():
+    import pandas as pd
+    import plotly.graph_objects as go
+
     df = _power_creep_df.loc[_power_creep_df['category'].isin(['Basic', 'Stage 1', 'Stage 2'])]
     fig = go.Figure()
     for x in _power_creep_df['set_block'].unique():
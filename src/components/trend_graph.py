@@ -1,8 +1,9 @@
 from dash import dcc
-import plotly.express as px
 
 
 def create_trend_graph(df):
+    import plotly.express as px
+
     date_range = [df.date.min(), df.date.max()]
     fig = px.line(
         df, x='date', y='percent', color='card_count',
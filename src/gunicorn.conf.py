@@ -27,3 +27,22 @@ worker_tmp_dir = "/dev/shm" if os.path.exists("/dev/shm") else tempfile.gettempd
 accesslog = "-"               # or None to save a bit of CPU
 errorlog = "-"
 loglevel = "info"
+
+
+def on_starting(server):
+    from utils import metrics
+    metrics.clear_snapshots()
+
+
+# Keep the landing pages' data warm, see utils/warmer.py, and write this
+# worker's metrics where the others can add them up, see utils/metrics.py
+def post_worker_init(worker):
+    from utils import metrics, warmer
+    warmer.start(worker.wsgi)
+    metrics.start_flusher()
+
+
+# so the archive has everything the worker counted
+def worker_exit(server, worker):
+    from utils import metrics
+    metrics.flush()
@@ -7,7 +7,6 @@ import datetime
 import io
 import json
 import numpy as np
-import pandas as pd
 
 from components import (deck_label, matchup_table, ternary_switch,
                         archetype_builder, tags as tag_settings,
@@ -15,6 +14,7 @@ from components import (deck_label, matchup_table, ternary_switch,
                         help_icon)
 import components.navbar
 import utils.data
+import utils.journal
 
 page_title = 'Battle Journal'
 page_icon = 'fa-book'
@@ -479,33 +479,24 @@ clientside_callback(
 )
 
 
-def create_deck_breakdown(data, decks):
-    breakdown = {}
-    overall = {'Win': 0, 'Loss': 0, 'Tie': 0, 'total': 0}
-    for m in data:
-        m_play = m['playing']
-        if not m['result']:
-            continue
-        if m_play not in breakdown:
-            breakdown[m_play] = {'Win': 0, 'Loss': 0, 'Tie': 0, 'total': 0}
-        breakdown[m_play][m['result']] += 1
-        breakdown[m_play]['total'] += 1
-
-        overall[m['result']] += 1
-        overall['total'] += 1
-    sort_breakdown = dict(sorted(breakdown.items(), key=lambda x: x[1]['total'], reverse=True))
+# `counts` is the (playing, against, W/L/T) array from `utils.journal`
+def create_deck_breakdown(deck_ids, counts, decks):
+    per_deck = counts.sum(axis=1)
+    overall = per_deck.sum(axis=0)
+    totals = per_deck.sum(axis=1)
+    sort_breakdown = sorted((i for i in range(len(deck_ids)) if totals[i] > 0), key=lambda i: totals[i], reverse=True)
     output = html.Div([
         html.H4('Breakdown'),
-        html.Div(f"Overall record: {overall['Win']}-{overall['Loss']}-{overall['Tie']}"),
-        html.Div(f"Overall win-rate: {(overall['Win'] / overall['total']):.1%}"),
+        html.Div(f"Overall record: {overall[0]}-{overall[1]}-{overall[2]}"),
+        html.Div(f"Overall win-rate: {(overall[0] / overall.sum()):.1%}"),
         dbc.Table([
             html.Thead(html.Tr([
                 html.Th('Deck'), html.Th('Record')
             ])),
             html.Tbody([
                 html.Tr([
-                    html.Td(deck_label.format_label(decks.get(b, deck_label.create_default_deck(b)))),
-                    html.Td(f"{breakdown[b]['Win']}-{breakdown[b]['Loss']}-{breakdown[b]['Tie']}")
+                    html.Td(deck_label.format_label(decks.get(deck_ids[b], deck_label.create_default_deck(deck_ids[b])))),
+                    html.Td(f"{per_deck[b][0]}-{per_deck[b][1]}-{per_deck[b][2]}")
                 ]) for b in sort_breakdown
             ])
         ])
@@ -513,59 +504,23 @@ def create_deck_breakdown(data, decks):
     return output
 
 
-def prep_matchup_spread(data):
-    matchup_dict = {}
-    for m in data:
-        if not m['result']:
-            continue
-        m_play = m['playing']
-        m_agai = m['against']
-        if m_play not in matchup_dict:
-            matchup_dict[m_play] = {}
-        if m_agai not in matchup_dict[m_play]:
-            matchup_dict[m_play][m_agai] = {'Win': 0, 'Loss': 0, 'Tie': 0}
-        matchup_dict[m_play][m_agai][m['result']] += 1
-
+def prep_matchup_spread(deck_ids, counts):
     matchup_list = []
-    for m in matchup_dict:
-        for a in matchup_dict[m]:
-            total = matchup_dict[m][a]['Win'] + matchup_dict[m][a]['Loss'] + matchup_dict[m][a]['Tie']
-            matchup = matchup_dict[m][a].copy()
-            matchup['playing'] = m
-            matchup['against'] = a
-            matchup['total'] = total
-            matchup['win_rate'] = round((matchup_dict[m][a]['Win'] + matchup_dict[m][a]['Tie']/3) / total * 100, 1)
-            matchup_list.append(matchup)
+    for m, a in zip(*np.nonzero(counts.sum(axis=2))):
+        wins, losses, ties = (int(v) for v in counts[m, a])
+        total = wins + losses + ties
+        matchup_list.append({
+            'Win': wins,
+            'Loss': losses,
+            'Tie': ties,
+            'playing': deck_ids[m],
+            'against': deck_ids[a],
+            'total': total,
+            'win_rate': round((wins + ties/3) / total * 100, 1),
+        })
     return matchup_list
 
 
-def handle_decompose(data, turn, tags, options):
-    included = set([t for t, t_val in zip(options, tags) if t_val == 1])
-    excluded = set([t for t, t_val in zip(options, tags) if t_val == -1])
-    decomposed_data = []
-    for d in data:
-        # handle the filtering
-        for i in range(3):
-            new_g = {
-                'playing': d['playing'],
-                'against': d['against'],
-                'result': d.get(f'game{i+1}', {}).get('result', None),
-                'turn': d.get(f'game{i+1}', {}).get('turn', 0),
-                'tags': d.get(f'game{i+1}', {}).get('tags', [])
-            }
-            if new_g['result'] is None:
-                continue
-            if turn != 0 and (int(new_g['turn']) if new_g['turn'] is not None else 0) != turn:
-                continue
-            tag_set = set(new_g['tags'] if new_g['tags'] is not None else [])
-            if len(set.intersection(tag_set, excluded)) > 0:
-                continue
-            if not included.issubset(tag_set):
-                continue
-            decomposed_data.append(new_g)
-    return decomposed_data
-
-
 @callback(
     Output(analysis, 'children'),
     Output(analysis_filter_text, 'children'),
@@ -604,17 +559,20 @@ def update_matchups(history_ts, data, archetype_ts, decks, decompose, tags, opti
     if len(data) == 0:
         return dbc.Alert('Please add matches before accessing analysis tools.', color='danger'), filter_text
 
-    filtered_data = data
+    journal = utils.journal.get_journal(data)
     if decompose:
-        filtered_data = handle_decompose(data, turn, tags, options)
+        included = [t for t, t_val in zip(options, tags) if t_val == 1]
+        excluded = [t for t, t_val in zip(options, tags) if t_val == -1]
+        deck_ids, counts = journal.matchup_counts(decompose=True, turn=turn, included=included, excluded=excluded)
     else:
         filter_text = 'Showing all.'
+        deck_ids, counts = journal.matchup_counts()
 
-    if len(filtered_data) == 0:
+    if counts.sum() == 0:
         return dbc.Alert('No games found matching the provided filters', color='warning'), filter_text
 
-    breakdown_data = create_deck_breakdown(filtered_data, decks)
-    matchup_list = prep_matchup_spread(filtered_data)
+    breakdown_data = create_deck_breakdown(deck_ids, counts, decks)
+    matchup_list = prep_matchup_spread(deck_ids, counts)
     matchup_data = html.Div([
         html.H4('Matchups'),
         matchup_table.create_matchup_spread(matchup_list, decks, player='playing', against='against')
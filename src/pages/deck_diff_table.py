@@ -124,12 +124,8 @@ def update_card_table(decks, labels, hide):
     for card in cards:
         counts = [c[1] for c in cards[card]['decks']]
         cards[card]['count'] = sum(counts) / len(decks)
-    card_info = []
-    for card in cards.values():
-        deck_counts = card['decks']
-        fetched_card = utils.cards.get_card(card)
-        fetched_card['decks'] = deck_counts
-        card_info.append(fetched_card)
+    fetched = utils.cards.get_many(utils.cards.card_identity(card) for card in cards.values())
+    card_info = [{**card, **fetched[utils.cards.card_identity(card)]} for card in cards.values()]
     sorted_cards = th_helpers.utils.cards.sort_deck(card_info)
 
     headers = [html.Th('')]
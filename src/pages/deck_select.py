@@ -4,7 +4,7 @@ import dash_bootstrap_components as dbc
 import math
 
 from components import tour_filter, deck_label
-from utils import colors, data, cache
+from utils import colors, data
 
 dash.register_page(
     __name__,
@@ -41,18 +41,13 @@ def layout(**kwargs):
     return cont
 
 
-@cache.cache.memoize(86400)
-def _fetch_decks(tf):
-    return data.get_decks(tf)
-
-
 @callback(
     Output(table, 'children'),
     Input(tour_store, 'data'),
     Input(_search, 'value')
 )
 def update_table(tf, search):
-    decks_raw = _fetch_decks(tf)
+    decks_raw = data.get_decks(tf)
     params = tour_filter.create_param_string(tf)
     body = html.Tbody([
         html.Tr([
@@ -1,7 +1,6 @@
 import dash
 from dash import exceptions, clientside_callback, ClientsideFunction, html, dcc, callback, Output, Input, State
 import dash_bootstrap_components as dbc
-import pandas as pd
 import urllib
 
 import components.card_table
@@ -318,12 +317,10 @@ def update_decklist_filter_text(include, exclude, granularity, placement, decks)
     Output(_card_selection, 'options'),
     Input(_filter_store, 'data')
 )
-@utils.cache.cache.memoize()
+@utils.cache.memoize(forced_update=utils.cache.is_refreshing)
 def update_card_dropdown_options(tour_filters):
-    url = f'{utils.data.api_url}/cards/{tour_filters["deck"]}'
-    r = utils.data.session.get(url, params=tour_filters)
-    if r.status_code == 200:
-        cards = r.json()
+    cards = utils.data.fetch(utils.data.card_options_request(tour_filters))
+    if cards is not None:
         formatted_cards = [{
             'value': c['card_code'],
             'label': f'{c["name"]} {c["card_code"]}',
@@ -340,7 +337,7 @@ def update_card_dropdown_options(tour_filters):
 )
 def update_against_archetype_options(data, tf):
     filtered_data = [d for d in data if d['id'] not in ['other', tf['deck']]]
-    against_ids = [o['id'] for o in filtered_data[:15]]
+    against_ids = utils.data.default_against_archetypes(data, tf['deck'])
     decks = [{
         'label': components.deck_label.format_label(deck),
         'value': deck['id'],
@@ -395,6 +392,13 @@ def update_deck_title(tf, current):
     except StopIteration:
         label = f'Deck {deck} not found.'
         deck_title = deck
+    # the matchup callbacks only fire after the against archetypes
+    # round trip, start their requests now with the default selection
+    against = utils.data.default_against_archetypes(decks, tf['deck'])
+    matchup_requests = [utils.data.card_matchups_request(tf, against)]
+    if tf['selected_card'] is not None:
+        matchup_requests.append(utils.data.card_matchups_request(tf, against, tf['selected_card']))
+    utils.data.prefetch(matchup_requests)
     return label, create_breadcrumb_items(deck_title, tf), decks
 
 
@@ -408,13 +412,8 @@ def update_deck_matchups(tf, options, against):
     if len(options) == 0:
         raise exceptions.PreventUpdate
 
-    url = f'{utils.data.analysis_url}/decklists/{tf["deck"]}/card-matchups/overall'
-    params = tf.copy()
-    params['against_archetypes'] = against
-    r = utils.data.session.post(url, params=params)
-    matchups = []
-    if r.status_code == 200:
-        matchups = r.json()['data']
+    resp = utils.data.fetch(utils.data.card_matchups_request(tf, against))
+    matchups = resp['data'] if resp else []
     decks = {d['name']: d for d in options}
     current_deck = next(d['name'] for d in options if d['id'] == tf['deck'])
     for m in matchups:
@@ -443,18 +442,10 @@ def _create_card_inclusion_bar(count, percentage):
     Input(_decklist_skeleton_view_toggle, 'value'),
 )
 def update_skeleton(tf, view):
-    url = f'{utils.data.analysis_url}/decklists/{tf["deck"]}/skeleton-counts'
-    params = tf.copy()
-    if 'include' in tf:
-        params['include_card'] = tf['include']
-    if 'exclude' in tf:
-        params['exclude_card'] = tf['exclude']
-    params['granularity'] = tf['granularity']
-    r = utils.data.session.post(url, params=params)
+    resp = utils.data.fetch(utils.data.skeleton_request(tf))
     out = {'cards': [], 'total': 0}
     total = out['total']
-    if r.status_code == 200:
-        resp = r.json()
+    if resp is not None:
         out['cards'] = resp['data']
         total = resp['total']
 
@@ -488,12 +479,10 @@ def update_skeleton(tf, view):
 def update_card_trend_children(tf):
     if tf['selected_card'] is None:
         return html.Div()
-    url = f'{utils.data.analysis_url}/decklists/{tf["deck"]}/trend/{tf["selected_card"]}'
-    r = utils.data.session.post(url, params=tf)
-    trend = []
-    if r.status_code == 200:
-        trend = r.json()['data']
+    resp = utils.data.fetch(utils.data.card_trend_request(tf))
+    trend = resp['data'] if resp else []
 
+    import pandas as pd
     df = pd.DataFrame.from_records(
         trend,
         columns=['date', 'card_count', 'counts', 'percent']
@@ -514,13 +503,8 @@ def update_card_matchups_children(tf, options, against):
     
     if len(options) == 0:
         raise exceptions.PreventUpdate
-    url = f'{utils.data.analysis_url}/decklists/{tf["deck"]}/card-matchups/{tf["selected_card"]}'
-    params = tf.copy()
-    params['against_archetypes'] = against
-    r = utils.data.session.post(url, params=params)
-    matchups = []
-    if r.status_code == 200:
-        matchups = r.json()['data']
+    resp = utils.data.fetch(utils.data.card_matchups_request(tf, against, tf['selected_card']))
+    matchups = resp['data'] if resp else []
 
     decks = {d['name']: d for d in options}
     return components.matchup_table.create_matchup_spread(matchups, decks, player='count', against='deck_other', small_view=True)
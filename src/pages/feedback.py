@@ -1,7 +1,6 @@
 import dash
 from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Output, Input, State, exceptions, no_update
 import dash_bootstrap_components as dbc
-import discord
 import os
 from dotenv import load_dotenv
 
@@ -129,6 +128,7 @@ clientside_callback(
 def submit_form(clicks, r, p, c, cm, cu):
     if clicks is None:
         raise exceptions.PreventUpdate
+    import discord
     hook = discord.SyncWebhook.from_url(webhook_url)
     content = f'**Reason**: {r}\n'\
               f'**Page**: {p}\n'\
@@ -2,7 +2,6 @@ import dash
 from dash import html, dcc, callback, Output, Input, State
 import dash_bootstrap_components as dbc
 import datetime
-import pandas as pd
 
 from components import (
     tour_filter, deck_label, matchup_table, placement,
@@ -10,6 +9,7 @@ from components import (
     feedback_link
 )
 from utils import data, cache
+import utils.matchups
 
 dash.register_page(
     __name__,
@@ -73,19 +73,12 @@ _matchups_help = f'{prefix}-matchups-help'
 _matchups_children = matchup_table.example
 
 
+# memoized here rather than on the callbacks, their other inputs are
+# rendered labels so the cache warmer could never reproduce their keys
+@cache.memoize(21600, forced_update=cache.is_refreshing)
 def fetch_breakdown_data(tour_data, placing=None):
-    params = tour_data.copy()
-    overall = []
-    if placing is not None:
-        params['placement'] = placing
-    else:
-        params['placement'] = 10_000
-
-    url = f'{data.analysis_url}/meta/breakdown'
-    r = data.session.post(url, params=params)
-    if r.status_code == 200:
-        overall = r.json()['overall']
-    return overall
+    resp = data.fetch(data.breakdown_request(tour_data, placing))
+    return resp['overall'] if resp else []
 
 
 def layout(**kwargs):
@@ -173,6 +166,11 @@ def layout(**kwargs):
     Input(tour_store, 'data')
 )
 def update_options(tour_filters):
+    # both breakdowns wait on these options, get their data moving first
+    data.prefetch([
+        data.breakdown_request(tour_filters),
+        data.breakdown_request(tour_filters, 8)
+    ])
     decks_raw = data.get_decks(tour_filters)
     decks = [{
         'label': deck_label.format_label(deck),
@@ -187,7 +185,6 @@ def update_options(tour_filters):
     Input(archetype_select, 'options'),
     Input(breakdown_show_more, 'value')
 )
-@cache.cache.memoize(21600)
 def update_breakdown_overall(tour_filters, archetypes, show_more):
     decks = {d['value']: d['label'] for d in archetypes}
     overall = fetch_breakdown_data(tour_filters)
@@ -240,7 +237,7 @@ def update_matchups(tour_filters, selected, place):
 )
 def update_matchup_children(data, archetypes):
     decks = {d['id']: d for d in archetypes}
-    return matchup_table.create_matchup_spread(data, decks)
+    return matchup_table.create_matchup_spread(data, decks, compact=True)
 
 @callback(
     Output(download_matchups, 'data'),
@@ -250,10 +247,7 @@ def update_matchup_children(data, archetypes):
 def download_matchup_as_csv(n_clicks, data):
     if n_clicks is None:
         raise dash.exceptions.PreventUpdate
-    df = pd.DataFrame.from_records(
-        data,
-        columns=['deck1', 'deck2', 'wins', 'losses', 'ties', 'total', 'win_rate']
-    )
+    df = utils.matchups.to_frame(utils.matchups.build_matrix(data))
     return dcc.send_data_frame(df.to_csv, filename=f'trainerhill-meta-matchups-{str(datetime.date.today())}.csv', index=False)
 
 
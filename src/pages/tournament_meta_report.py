@@ -1,15 +1,16 @@
 import base64
-from collections import defaultdict
 import dash
-from dash import html, dcc, callback, Output, Input, State, ALL, ctx, Patch, clientside_callback, ClientsideFunction
+from dash import html, dcc, callback, Output, Input, State, ALL, clientside_callback, ClientsideFunction
 import dash_bootstrap_components as dbc
 import dash_bootstrap_templates as dbt
 import datetime
-import xml.etree.ElementTree as ET
+import numpy as np
 
 from components import deck_label, matchup_table, breakdown, download_button, navbar, feedback_link, help_icon
 import utils.data
 import utils.date
+import utils.tdf
+import utils.tournament
 
 dash.register_page(
     __name__,
@@ -32,7 +33,7 @@ _help_children = html.Ul([
     html.Li([html.Strong('Prototype dashboard:'), ' This dashboard is a work in progress. Some things are not yet finalized.']),
     html.Li([html.Strong('Purpose:'), ' This dashboard allows Tournamet Organizers to see a snapshot of the local meta.']),
     html.Li([html.Strong('Usage:'), ' Upload a tdf, choose a deck for each player, inpsect breakdown and matchups.']),
-    html.Li([html.Strong('Data Privacy:'), " The uploaded data is processed to display relevant information, but no information is collected. If you clear cookies or click the clear button, your data will be deleted forever."]),
+    html.Li([html.Strong('Data Privacy:'), " The uploaded data is processed to display relevant information, but no information is collected. The processed tournament is kept on our server for up to a day after it was uploaded, clicking the clear button removes it from this browser."]),
     feedback_link.list_item('none'),
 ], className='mb-0')
 
@@ -68,7 +69,6 @@ roster_table = f'{roster_prefix}-table'
 roster_deck_select = f'{roster_prefix}-deck-select'
 roster_player = f'{roster_prefix}-player-row'
 roster_store = f'{roster_prefix}-store'
-roster_archetype_store = f'{roster_prefix}-archetype-store'
 roster_player_sort = f'{roster_prefix}-player-sort-btn'
 roster_player_sort_icon = f'{roster_prefix}-player-sort-icon'
 roster_tab = html.Div([
@@ -108,8 +108,6 @@ report_tab = html.Div([
 ], id=report_wrapper, className='p-1')
 
 def layout():
-    archetypes = utils.data.get_decks({'start_date': datetime.date.today() - datetime.timedelta(days=21)})
-    decks = {d['id']: d for d in archetypes}
     return html.Div([
         html.Div([
             html.H2('Tournament Meta Report', className='d-inline-block'),
@@ -128,8 +126,7 @@ def layout():
             dbc.Tab(roster_tab, label='Roster', tab_id=roster_prefix),
             dbc.Tab(report_tab, label='Report', tab_id=report_prefix),
         ], id=tabs, persistence=True, persistence_type='local'),
-        dcc.Store(id=store, data={}, storage_type='local'),
-        dcc.Store(id=roster_archetype_store, data=decks)
+        dcc.Store(id=store, data={}, storage_type='local')
     ])
 
 clientside_callback(
@@ -143,94 +140,24 @@ clientside_callback(
 )
 
 
-def etree_to_dict(t):
-    d = {t.tag: {} if t.attrib else None}
-    children = list(t)
-    if children:
-        dd = defaultdict(list)
-        for dc in map(etree_to_dict, children):
-            for k, v in dc.items():
-                dd[k].append(v)
-        d = {t.tag: {k:v[0] if len(v) == 1 else v for k, v in dd.items()}}
-    if t.attrib:
-        d[t.tag].update(('@' + k, v) for k, v in t.attrib.items())
-    if t.text:
-        text = t.text.strip()
-        if children or t.attrib:
-            if text:
-              d[t.tag]['#text'] = text
-        else:
-            d[t.tag] = text
-    return d
-
-def parse_file_content(contents, filename):
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    parsed_content = {}
-    try:
-        if filename.endswith('.tdf'):
-            root = ET.fromstring(decoded)
-            parsed_content = etree_to_dict(root)
-            return parsed_content
+def read_file_content(contents, filename):
+    if not filename.endswith('.tdf'):
         raise NameError('Unable to parse filename.')
-    except Exception as e:
-        raise e
-
-
-def create_record_dict(pods):
-    matches = []
-    pods = pods if isinstance(pods, list) else [pods]
-    for pod in pods:
-        rounds = pod['rounds']['round']
-        for round_info in rounds:
-            round_matches = round_info['matches']['match']
-            round_matches = round_matches if isinstance(round_matches, list) else [round_matches]
-            matches.extend(round_matches)
-    records = {}
-    for match in matches:
-        outcome = int(match['@outcome'])
-        if 'player1' in match and 'player2' in match:
-            p1 = match['player1']['@userid']
-            if p1 not in records:
-                records[p1] = {'wins': 0, 'losses': 0, 'ties': 0, 'played': set()}
-            p2 = match['player2']['@userid']
-            if p2 not in records:
-                records[p2] = {'wins': 0, 'losses': 0, 'ties': 0, 'played': set()}
-            if outcome == 1:
-                records[p1]['wins'] += 1
-                records[p2]['losses'] += 1
-            elif outcome == 2:
-                records[p1]['losses'] += 1
-                records[p2]['wins'] += 1
-            elif outcome == 3:
-                records[p1]['ties'] += 1
-                records[p2]['ties'] += 1
-            else:
-                print(match)
-                break
-            records[p1]['played'].add(p2)
-            records[p2]['played'].add(p1)
-        # handle bye
-        elif outcome == 5 and 'player' in match:
-            p = match['player']['@userid']
-            if p not in records:
-                records[p] = {'wins': 0, 'losses': 0, 'ties': 0, 'played': set()}
-            records[p]['wins'] += 1
-        # handle late to round 1
-        elif outcome == 8 and 'player' in match:
-            p = match['player']['@userid']
-            if p not in records:
-                records[p] = {'wins': 0, 'losses': 0, 'ties': 0, 'played': set()}
-            records[p]['losses'] += 1
-        else:
-            print(match)
-            break
-        # check for ties or dgl or bye
-        # grab player
-        player = ''
-        if player not in records:
-            records[player] = {'wins': 0, 'losses': 0, 'ties': 0}
-    return records
+    content_type, content_string = contents.split(',')
+    return base64.b64decode(content_string)
+
+
+def get_archetypes():
+    archetypes = utils.data.get_decks({'start_date': datetime.date.today() - datetime.timedelta(days=21)})
+    return {d['id']: d for d in archetypes}
+
+
+# the uploaded tournament for a `store`, `None` when nothing was uploaded or
+# the server side copy has expired
+def load_model(tdf):
+    if not tdf or 'key' not in tdf:
+        return None
+    return utils.tournament.load(tdf['key'])
 
 
 @callback(
@@ -246,26 +173,19 @@ def upload_data(contents, filename, last_mod, curr_roster):
     if contents is None:
         raise dash.exceptions.PreventUpdate
     try:
-        tdf_contents = parse_file_content(contents, filename)
+        raw = read_file_content(contents, filename)
+        key = utils.tournament.content_key(raw)
+        model = utils.tournament.load(key)
+        if model is None:
+            model = utils.tournament.TournamentModel.from_tdf(utils.tdf.parse(raw))
+            utils.tournament.save(key, model)
     except Exception:
         raise dash.exceptions.PreventUpdate
-    
-    tour_info = tdf_contents['tournament']
-    # TODO iterate over matches to create record object then set record
-    records = create_record_dict(tour_info['pods']['pod'])
-    players_list = tour_info['players']['player']
-    standings = tour_info.get('standings', {}).get('pod', [])
-    for p in players_list:
-        if len(standings) == 0:
-            continue
-        p_id = p['@userid']
-        record = records[p_id]
-        curr_roster[p_id] = p
-        curr_roster[p_id]['deck'] = 'other'
-        curr_roster[p_id]['standing'] = next(standing['@place'] for pod in standings if pod.get('@type') == 'finished' for standing in pod.get('player', []) if standing['@id'] == p_id)
-        curr_roster[p_id]['record'] = f"{record['wins']}-{record['losses']}-{record['ties']}"
-        curr_roster[p_id]['division'] = DIVISIONS[next(int(pod['@category']) for pod in standings for standing in pod.get('player', []) if standing['@id'] == p_id)]
-    return tdf_contents, curr_roster, roster_prefix
+
+    # keep decks already assigned to players in this event, re-uploading a
+    # later export of the same tournament does not lose them
+    roster = {p_id: deck for p_id, deck in curr_roster.items() if isinstance(deck, str) and p_id in model.player_index}
+    return {'key': key}, roster, roster_prefix
 
 
 @callback(
@@ -280,12 +200,14 @@ def update_upload_message(ts):
     return warning
 
 
-def create_roster_row(player, decks):
-    name = player['firstname'] + ' ' + player['lastname']
-    standing = player['standing']
-    division = player['division'][0].upper()
-    record = player['record']
-    id = player['@userid']
+def create_roster_row(model, i, deck, decks):
+    firstname, lastname = model.names[i]
+    name = firstname + ' ' + lastname
+    place = int(model.places[i])
+    standing = str(place) if place else ''
+    division = DIVISIONS[model.categories[i]][0].upper()
+    record = model.record(i)
+    id = model.player_ids[i]
     return html.Tr([
         html.Td(standing, className='text-center'),
         html.Td(name),
@@ -294,28 +216,33 @@ def create_roster_row(player, decks):
         html.Td(dcc.Dropdown(
             id={'index': id, 'type': roster_deck_select},
             options=decks,
-            value=player.get('deck', 'other'),
+            value=deck,
             clearable=False
         ), className='w-50')
     ], id={'index': id, 'type': roster_player}, className='tour-meta-report-row')
 
 
+# Rebuilt when a tournament is uploaded or the sort changes. Deck changes
+# come from the dropdowns in this table so they do not need a rebuild.
 @callback(
     Output(roster_table, 'children'),
-    Input(roster_store, 'modified_timestamp'),
+    Input(store, 'modified_timestamp'),
+    State(store, 'data'),
     State(roster_store, 'data'),
-    State(roster_archetype_store, 'data'),
     Input(roster_player_sort, 'n_clicks'),
 )
-def update_roster_table(ts, data, decks, sort_dir):
+def update_roster_table(ts, tdf, roster, sort_dir):
     if ts is None:
         raise dash.exceptions.PreventUpdate
-    deck_options = [{'label': deck_label.format_label(d), 'value': d['id'], 'search': d['name']} for d in decks.values()]
+    model = load_model(tdf)
+    if model is None or len(model.standings) == 0:
+        return []
+    deck_options = [{'label': deck_label.format_label(d), 'value': d['id'], 'search': d['name']} for d in get_archetypes().values()]
     rows = []
-    players = data.values()
-    players = players if sort_dir is None else sorted(players, key=lambda x: x['firstname'], reverse=sort_dir % 2 == 0)
-    for player in players:
-        rows.append(create_roster_row(player, deck_options))
+    players = range(len(model.player_ids))
+    players = players if sort_dir is None else sorted(players, key=lambda i: model.names[i][0], reverse=sort_dir % 2 == 0)
+    for i in players:
+        rows.append(create_roster_row(model, i, roster.get(model.player_ids[i], 'other'), deck_options))
     return rows
 
 
@@ -332,18 +259,15 @@ clientside_callback(
 )
 
 
-@callback(
+# the roster only holds player id to deck, changing a deck is handled in the
+# browser instead of sending every dropdown value to the server
+clientside_callback(
+    ClientsideFunction(namespace='clientside', function_name='set_tour_report_deck'),
     Output(roster_store, 'data', allow_duplicate=True),
     Input({'type': roster_deck_select, 'index': ALL}, 'value'),
+    State(roster_store, 'data'),
     prevent_initial_call=True
 )
-def update_roster(values):
-    if len(ctx.triggered) > 1 or ctx.triggered_id is None:
-        raise dash.exceptions.PreventUpdate
-    idx = ctx.triggered_id['index']
-    patch = Patch()
-    patch[idx]['deck'] = ctx.triggered[0]['value']
-    return patch
 
 
 @callback(
@@ -354,10 +278,13 @@ def update_roster(values):
 def update_report_information(tdf_ts, tdf):
     if tdf_ts is None:
         raise dash.exceptions.PreventUpdate
-    if 'tournament' not in tdf:
+    if not tdf or 'key' not in tdf:
         return 'No data is currently available.'
+    model = load_model(tdf)
+    if model is None:
+        return 'The uploaded tournament has expired, please upload the .tdf file again.'
 
-    ti = tdf['tournament']['data']
+    ti = model.info
     return [
         html.H3(ti['name']),
         html.P([
@@ -374,32 +301,28 @@ def update_report_information(tdf_ts, tdf):
     State(roster_store, 'data'),
     Input(store, 'modified_timestamp'),
     State(store, 'data'),
-    State(roster_archetype_store, 'data'),
 )
-def update_report_podiums(roster_ts, roster, tdf_ts, tdf, archetypes):
+def update_report_podiums(roster_ts, roster, tdf_ts, tdf):
     if roster_ts is None or tdf_ts is None:
         raise dash.exceptions.PreventUpdate
     output = []
-    if 'tournament' not in tdf: return output
-    standings = tdf['tournament'].get('standings', {}).get('pod', [])
-    for pod in standings:
-        if pod['@type'] != 'finished':
-            continue
-        players = pod.get('player', [])
-        if len(players) == 0:
-            continue
+    model = load_model(tdf)
+    if model is None: return output
+    archetypes = get_archetypes()
+    for category, players in model.standings.items():
         pod_output = []
         for i, player in enumerate(players[:4]):
-            p = roster[player['@id']]
+            firstname, lastname = model.names[player]
+            deck = roster.get(model.player_ids[player], 'other')
             pod_output.append(
                 html.Tr([
                     html.Td(f'{i+1}.'),
-                    html.Td(p['firstname'] + ' ' + p['lastname'][0] + '.'),
-                    html.Td(deck_label.format_label(archetypes[p['deck']]))
+                    html.Td(firstname + ' ' + lastname[0] + '.'),
+                    html.Td(deck_label.format_label(archetypes[deck]))
                 ], className='tour-meta-report-row')
             )
         card = dbc.Col(dbc.Card([
-            html.H4([html.Span(className='fas fa-crown me-1'), DIVISIONS[int(pod['@category'])].title(), ' - ', len(players)]),
+            html.H4([html.Span(className='fas fa-crown me-1'), DIVISIONS[category].title(), ' - ', len(players)]),
             dbc.Table(html.Tbody(pod_output))
         ], body=True), md=6, xl=4)
         output.append(card)
@@ -412,21 +335,20 @@ def update_report_podiums(roster_ts, roster, tdf_ts, tdf, archetypes):
     State(roster_store, 'data'),
     Input(store, 'modified_timestamp'),
     State(store, 'data'),
-    State(roster_archetype_store, 'data'),
     Input(dbt.ThemeSwitchAIO.ids.switch(navbar.theme), 'value')
 )
-def update_report_breakdown(roster_ts, roster, tdf_ts, tdf, archetypes, theme):
+def update_report_breakdown(roster_ts, roster, tdf_ts, tdf, theme):
     if roster_ts is None or tdf_ts is None:
         raise dash.exceptions.PreventUpdate
-    deck_counts = {}
-    for player in roster.values():
-        p_deck = player['deck']
-        if p_deck not in deck_counts:
-            deck_counts[p_deck] = 0
-        deck_counts[p_deck] += 1
+    model = load_model(tdf)
+    if model is None:
+        return ''
+    archetypes = get_archetypes()
+    deck_ids, _, deck_counts = utils.tournament.get_aggregate(tdf['key'], model).update(roster)
     decks = []
-    for d in deck_counts:
-        count = deck_counts[d]
+    for d, count in zip(deck_ids, deck_counts.tolist()):
+        if count == 0:
+            continue
         decks.append({
             'deck': d,
             'count': count,
@@ -450,56 +372,26 @@ def update_report_breakdown(roster_ts, roster, tdf_ts, tdf, archetypes, theme):
     State(roster_store, 'data'),
     Input(store, 'modified_timestamp'),
     State(store, 'data'),
-    State(roster_archetype_store, 'data')
 )
-def update_report_matchups(roster_ts, roster, tdf_ts, tdf, decks):
+def update_report_matchups(roster_ts, roster, tdf_ts, tdf):
     if roster_ts is None or tdf_ts is None:
         raise dash.exceptions.PreventUpdate
-    if 'tournament' not in tdf:
+    model = load_model(tdf)
+    if model is None:
         return ''
-    matchups = {}
-    pods = tdf['tournament']['pods']['pod']
-    pods = pods if isinstance(pods, list) else [pods]
-    for pod in pods:
-        rounds = pod['rounds']['round']
-        for round_info in rounds:
-            round_matches = round_info['matches']['match']
-            round_matches = round_matches if isinstance(round_matches, list) else [round_matches]
-            for match in round_matches:
-                if 'player1' in match and 'player2' in match:
-                    p1_deck = roster[match['player1']['@userid']]['deck']
-                    p2_deck = roster[match['player2']['@userid']]['deck']
-                    winner = match['@outcome']
-                    if p1_deck not in matchups:
-                        matchups[p1_deck] = {}
-                    if p2_deck not in matchups:
-                        matchups[p2_deck] = {}
-
-                    if p1_deck not in matchups[p2_deck]:
-                        matchups[p2_deck][p1_deck] = {'wins': 0, 'losses': 0, 'ties': 0}
-                    if p2_deck not in matchups[p1_deck]:
-                        matchups[p1_deck][p2_deck] = {'wins': 0, 'losses': 0, 'ties': 0}
-                    if winner == '1':
-                        matchups[p2_deck][p1_deck]['losses'] += 1
-                        matchups[p1_deck][p2_deck]['wins'] += 1
-                    elif winner == '2':
-                        matchups[p2_deck][p1_deck]['wins'] += 1
-                        matchups[p1_deck][p2_deck]['losses'] += 1
-                    elif winner == '3':
-                        matchups[p2_deck][p1_deck]['ties'] += 1
-                        matchups[p1_deck][p2_deck]['ties'] += 1
-                    else:
-                        pass
+    decks = get_archetypes()
+    deck_ids, counts, _ = utils.tournament.get_aggregate(tdf['key'], model).update(roster)
     matchup_list = []
-    for m in matchups:
-        for a in matchups[m]:
-            total = matchups[m][a]['wins'] + matchups[m][a]['losses'] + matchups[m][a]['ties']
-            if total == 0:
-                continue
-            matchup = matchups[m][a].copy()
-            matchup['playing'] = m
-            matchup['against'] = a
-            matchup['total'] = total
-            matchup['win_rate'] = round((matchups[m][a]['wins'] + matchups[m][a]['ties']/3) / total * 100, 1)
-            matchup_list.append(matchup)
-    return matchup_table.create_matchup_spread(matchup_list, decks, player='playing', against='against')
+    for m, a in zip(*np.nonzero(counts.sum(axis=2))):
+        wins, losses, ties = (int(v) for v in counts[m, a])
+        total = wins + losses + ties
+        matchup_list.append({
+            'wins': wins,
+            'losses': losses,
+            'ties': ties,
+            'playing': deck_ids[m],
+            'against': deck_ids[a],
+            'total': total,
+            'win_rate': round((wins + ties/3) / total * 100, 1),
+        })
+    return matchup_table.create_matchup_spread(matchup_list, decks, player='playing', against='against', compact=True)
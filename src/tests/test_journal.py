@@ -0,0 +1,126 @@
+import random
+
+from utils import journal
+
+DECKS = ['a', 'b', 'c', 'd']
+# more than one mask word
+TAGS = [f'tag{i}' for i in range(70)]
+
+
+# The Battle Journal analysis before `utils.journal`, kept as the reference
+# the columnar counts are checked against.
+def legacy_handle_decompose(data, turn, tags, options):
+    included = set([t for t, t_val in zip(options, tags) if t_val == 1])
+    excluded = set([t for t, t_val in zip(options, tags) if t_val == -1])
+    decomposed_data = []
+    for d in data:
+        for i in range(3):
+            new_g = {
+                'playing': d['playing'],
+                'against': d['against'],
+                'result': d.get(f'game{i+1}', {}).get('result', None),
+                'turn': d.get(f'game{i+1}', {}).get('turn', 0),
+                'tags': d.get(f'game{i+1}', {}).get('tags', [])
+            }
+            if new_g['result'] is None:
+                continue
+            if turn != 0 and (int(new_g['turn']) if new_g['turn'] is not None else 0) != turn:
+                continue
+            tag_set = set(new_g['tags'] if new_g['tags'] is not None else [])
+            if len(set.intersection(tag_set, excluded)) > 0:
+                continue
+            if not included.issubset(tag_set):
+                continue
+            decomposed_data.append(new_g)
+    return decomposed_data
+
+
+def legacy_prep_matchup_spread(data):
+    matchup_dict = {}
+    for m in data:
+        if not m['result']:
+            continue
+        m_play = m['playing']
+        m_agai = m['against']
+        if m_play not in matchup_dict:
+            matchup_dict[m_play] = {}
+        if m_agai not in matchup_dict[m_play]:
+            matchup_dict[m_play][m_agai] = {'Win': 0, 'Loss': 0, 'Tie': 0}
+        matchup_dict[m_play][m_agai][m['result']] += 1
+    return {
+        (m, a): (r['Win'], r['Loss'], r['Tie'])
+        for m, against in matchup_dict.items() for a, r in against.items()
+    }
+
+
+def spread(deck_ids, counts):
+    return {
+        (deck_ids[m], deck_ids[a]): tuple(int(v) for v in counts[m, a])
+        for m in range(len(deck_ids)) for a in range(len(deck_ids)) if counts[m, a].sum()
+    }
+
+
+def make_match(rng, i):
+    match = {
+        'time': str(i),
+        'playing': rng.choice(DECKS),
+        'against': rng.choice(DECKS),
+        'result': rng.choice(['Win', 'Loss', 'Tie', None]),
+    }
+    for g in range(rng.randint(0, 3)):
+        match[f'game{g+1}'] = {
+            'result': rng.choice(['Win', 'Loss', 'Tie']),
+            'turn': rng.choice([1, 2, '1', '2', None]),
+            'tags': rng.sample(TAGS, rng.randint(0, 4)) if rng.random() < 0.9 else None,
+        }
+    return match
+
+
+def legacy_filtered(data, turn, included, excluded):
+    options = list(included) + list(excluded)
+    values = [1] * len(included) + [-1] * len(excluded)
+    return legacy_prep_matchup_spread(legacy_handle_decompose(data, turn, values, options))
+
+
+def test_matchup_counts_match_legacy_as_history_grows():
+    rng = random.Random(0)
+    data = []
+    for _ in range(150):
+        data = data + [make_match(rng, len(data) + k) for k in range(rng.randint(1, 5))]
+        j = journal.get_journal(data)
+        assert len(j) == len(data)
+        assert spread(*j.matchup_counts()) == legacy_prep_matchup_spread(data)
+
+        turn = rng.choice([0, 1, 2])
+        included = rng.sample(TAGS, rng.randint(0, 2))
+        excluded = rng.sample([t for t in TAGS if t not in included], rng.randint(0, 2))
+        got = spread(*j.matchup_counts(True, turn, included, excluded))
+        assert got == legacy_filtered(data, turn, included, excluded)
+
+
+def test_matchup_counts_on_common_tags():
+    rng = random.Random(1)
+    data = [make_match(rng, i) for i in range(300)]
+    for match in data:
+        for g in range(3):
+            game = match.get(f'game{g+1}')
+            if game and game['tags'] is not None:
+                game['tags'].append(rng.choice(['early', 'late']))
+    j = journal.Journal()
+    assert j.sync(data)
+    for included, excluded in [(['early'], []), ([], ['early']), (['late', TAGS[65]], []), (['unknown'], [])]:
+        got = spread(*j.matchup_counts(True, 0, included, excluded))
+        assert got == legacy_filtered(data, 0, included, excluded)
+
+
+def test_edited_history_is_rebuilt():
+    rng = random.Random(2)
+    data = [make_match(rng, i) for i in range(20)]
+    j = journal.get_journal(data)
+    assert not j.sync(data[:10])
+    edited = [dict(m) for m in data]
+    edited[5]['result'] = 'Win' if edited[5]['result'] != 'Win' else 'Loss'
+    assert not j.sync(edited)
+    rebuilt = journal.get_journal(edited)
+    assert rebuilt is not j
+    assert spread(*rebuilt.matchup_counts()) == legacy_prep_matchup_spread(edited)
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# only imported by the callbacks that need them, plotly.graph_objects is
+# left out as dcc.Graph imports it
+DEFERRED = ['pandas', 'plotly.express', 'discord']
+
+
+def run_app_import(script, **env):
+    env = {
+        **os.environ,
+        'PYTHONPATH': SRC,
+        'TRAINER_HILL_API_KEY': 'test',
+        'FEEDBACK_URL': 'http://localhost/feedback',
+        **env,
+    }
+    env.pop('TH_DEPLOY', None)
+    # a fresh interpreter, the app reads its assets relative to `src`
+    result = subprocess.run(
+        [sys.executable, '-c', f'import app, sys, json\n{script}'],
+        cwd=SRC, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_heavy_dependencies_not_imported_at_startup():
+    out = run_app_import(f'print(json.dumps([m for m in {DEFERRED!r} if m in sys.modules]))')
+    assert json.loads(out.splitlines()[-1]) == []
+
+
+def test_pages_still_registered():
+    out = run_app_import("print(len(app.server.test_client().get('/_dash-dependencies').json))")
+    assert int(out.splitlines()[-1]) > 0
+
+
+def test_import_report_lists_pages():
+    out = run_app_import('', TH_IMPORT_REPORT='1')
+    assert 'Import cost per page' in out
+    assert 'pages.' in out
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils import metrics
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+def _worker(pid, counter=0, gauge=None, observations=()):
+    histogram = metrics._Histogram(metrics.SECONDS_BUCKETS)
+    for value in observations:
+        histogram.observe(value)
+    snapshot = {
+        'counters': {('test_requests_total', ()): counter},
+        'gauges': {} if gauge is None else {('test_entries', ()): gauge, ('test_free_bytes', ()): gauge},
+        'histograms': {('test_seconds', ()): (histogram.buckets, histogram.counts, histogram.sum, histogram.count)},
+    }
+    metrics._write(os.path.join(metrics.METRICS_DIR, f'{pid}.pickle'), snapshot)
+
+
+def _value(text, series):
+    for line in text.splitlines():
+        if line.startswith(series + ' '):
+            return float(line.split()[-1])
+    return None
+
+
+metrics.describe('test_requests_total', 'counter', 'Test counter.')
+metrics.describe('test_entries', 'gauge', 'Test gauge each worker holds a share of.')
+metrics.describe('test_free_bytes', 'gauge', 'Test gauge every worker reads the same.', merge='max')
+metrics.describe('test_seconds', 'histogram', 'Test histogram.')
+
+
+def test_workers_are_added_up_without_a_worker_label():
+    metrics.inc('test_requests_total', value=2)
+    metrics.set_gauge('test_entries', None, 3)
+    metrics.set_gauge('test_free_bytes', None, 100)
+    metrics.observe('test_seconds', None, 0.2)
+    # the parent process stands in for another live worker
+    _worker(os.getppid(), counter=5, gauge=7, observations=[0.2, 20])
+
+    text = metrics.render()
+    assert 'worker=' not in text
+    assert _value(text, 'test_requests_total') == 7
+    assert _value(text, 'test_entries') == 10
+    assert _value(text, 'test_free_bytes') == 100
+    assert _value(text, 'test_seconds_count') == 3
+    assert _value(text, 'test_seconds_bucket{le="0.25"}') == 2
+    assert _value(text, 'test_seconds_bucket{le="+Inf"}') == 3
+
+
+def test_exited_worker_counts_are_kept(metrics_dir):
+    before = _value(metrics.render(), 'test_requests_total') or 0
+    pid = _dead_pid()
+    _worker(pid, counter=4, gauge=1000, observations=[1])
+
+    text = metrics.render()
+    assert not (metrics_dir / f'{pid}.pickle').exists()
+    assert _value(text, 'test_requests_total') == before + 4
+    assert _value(text, 'test_free_bytes') != 1000
+    # folded once, a second scrape does not count it again
+    assert _value(metrics.render(), 'test_requests_total') == before + 4
@@ -0,0 +1,119 @@
+import pytest
+import time
+
+from utils.cache_backends import SharedMemoryCache, TwoTierCache
+
+KB = 1024
+
+
+@pytest.fixture
+def shm(tmp_path):
+    return SharedMemoryCache(str(tmp_path / 'cache'), size=256 * KB, slots=64, block_size=KB)
+
+
+def test_roundtrip_and_multi_block_values(shm):
+    value = bytes(range(256)) * 20
+    assert shm.set('k', value)
+    assert shm.get('k') == value
+    assert shm.get('missing') is None
+
+
+def test_add_only_sets_new_keys(shm):
+    assert shm.add('lock', 1)
+    assert not shm.add('lock', 2)
+    assert shm.get('lock') == 1
+    shm.delete('lock')
+    assert shm.add('lock', 3)
+
+
+def test_evicts_least_recently_used(shm):
+    blocks = shm.n_blocks
+    value = b'x' * (8 * KB)  # 9 blocks with the pickle header
+    for i in range(blocks // 9):
+        assert shm.set(f'k{i}', value)
+    assert shm.evictions == 0
+    # touch the oldest so the next one in line goes instead
+    assert shm.get('k0') == value
+    assert shm.set('new', value)
+    assert shm.evictions >= 1
+    assert shm.get('k0') == value
+    assert shm.get('k1') is None
+    assert shm.get('new') == value
+
+
+def test_evicts_expired_first(shm, monkeypatch):
+    value = b'x' * (8 * KB)
+    n = shm.n_blocks // 9
+    shm.set('expiring', value, timeout=10)
+    for i in range(n - 1):
+        shm.set(f'k{i}', value)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 60)
+    assert shm.set('new', value)
+    assert shm.get('k0') == value
+    assert shm.get('expiring') is None
+
+
+def test_blocks_are_reused_as_values_cycle(shm):
+    free = shm.stats()['free_bytes']
+    # write several times the pool through the same few keys
+    for i in range(200):
+        value = bytes([i % 256]) * ((i * 997) % (20 * KB) + 1)
+        assert shm.set(f'k{i % 7}', value)
+        assert shm.get(f'k{i % 7}') == value
+    for i in range(7):
+        shm.delete(f'k{i}')
+    assert shm.stats() == {'entries': 0, 'free_bytes': free, 'evictions': shm.evictions}
+
+
+def _keys_in_slot(shm, slot, count):
+    keys = []
+    i = 0
+    while len(keys) < count:
+        key = f'key{i}'
+        if shm._hash(key)[0] % shm.n_slots == slot:
+            keys.append(key)
+        i += 1
+    return keys
+
+
+def test_probe_wraps_around_table_end(shm):
+    last = shm.n_slots - 1
+    keys = _keys_in_slot(shm, last, 3)
+    for n, key in enumerate(keys):
+        assert shm.set(key, n)
+    # the second and third landed at the start of the table
+    assert shm._slots['state'][0] != 0 and shm._slots['state'][1] != 0
+    assert [shm.get(k) for k in keys] == [0, 1, 2]
+    # a tombstone in the middle of the chain keeps the rest reachable
+    shm.delete(keys[1])
+    assert shm.get(keys[1]) is None
+    assert shm.get(keys[2]) == 2
+    assert shm.set(keys[1], 'again')
+    assert [shm.get(k) for k in keys] == [0, 'again', 2]
+
+
+def test_table_thinned_when_nearly_full(shm):
+    for i in range(shm.n_slots * 2):
+        assert shm.set(f'k{i}', i)
+    # never runs out of empty slots to end a probe on
+    assert shm.stats()['entries'] < shm.n_slots * 0.9 + 1
+    assert shm.get(f'k{shm.n_slots * 2 - 1}') == shm.n_slots * 2 - 1
+
+
+def test_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'cache')
+    a = SharedMemoryCache(path, size=256 * KB, slots=64, block_size=KB)
+    b = SharedMemoryCache(path, size=256 * KB, slots=64, block_size=KB)
+    a.set('k', 'v')
+    assert b.get('k') == 'v'
+
+
+def test_oversized_value_under_two_tier_stores_nothing(shm):
+    a, b = TwoTierCache(shm, revalidate=0), TwoTierCache(shm, revalidate=0)
+    a.set('k', 'old')
+    assert b.get('k') == 'old'
+    # bigger than the whole pool, the stamp fits but the value does not
+    assert not a.set('k', b'x' * 512 * KB)
+    assert b.get('k') is None
+    assert shm.get('k.__stamp') is None
@@ -0,0 +1,82 @@
+import os
+
+from benchmarks.tdf_parse import legacy_parse, make_tdf
+from utils import tdf
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'tournament.tdf')
+
+
+def _list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+# the records the old dict conversion held, pulled out the way the
+# report used to walk it
+def legacy_records(raw):
+    t = legacy_parse(raw)['tournament']
+    players = [
+        (p['@userid'], p['firstname'], p['lastname'], p['birthdate'])
+        for p in _list(t['players']['player'])
+    ]
+    matches = []
+    for pod in _list(t['pods']['pod']):
+        category = int(pod['@category'])
+        for r in _list(pod['rounds']['round']):
+            for m in _list((r['matches'] or {}).get('match')):
+                player1 = m.get('player1', m.get('player'))
+                player2 = m.get('player2')
+                table = m.get('tablenumber')
+                matches.append((
+                    category, int(r['@number']), int(m['@outcome']),
+                    player1['@userid'], player2['@userid'] if player2 else None,
+                    int(table) if table else None,
+                ))
+    standings = []
+    for pod in _list(t['standings']['pod']):
+        for p in _list(pod.get('player')):
+            standings.append((int(pod['@category']), pod['@type'], p['@id'], int(p['@place'])))
+    return t['data'], players, matches, standings
+
+
+def check_against_legacy(raw):
+    data, players, matches, standings = legacy_records(raw)
+    parsed = tdf.parse(raw)
+    assert [tuple(p) for p in parsed.players] == players
+    assert sorted(tuple(m) for m in parsed.matches) == sorted(matches)
+    assert [tuple(s) for s in parsed.standings] == standings
+    assert parsed.info['name'] == data['name']
+    assert parsed.info['startdate'] == data['startdate']
+    assert parsed.info['organizer'] == data['organizer']['@name']
+    return parsed
+
+
+def test_fixture_matches_legacy_parser():
+    with open(FIXTURE, 'rb') as f:
+        raw = f.read()
+    parsed = check_against_legacy(raw)
+    assert len(parsed.players) == 9
+    assert [(p.category, p.stage) for p in parsed.pods] == [(0, 5), (2, 5), (2, 8)]
+    assert len(parsed.rounds) == 6
+    assert parsed.info['organizer_popid'] == '4242'
+
+
+def test_fixture_single_player_matches():
+    parsed = tdf.parse(FIXTURE)
+    singles = {m.outcome: m for m in parsed.matches if m.player2 is None}
+    assert singles[tdf.OUTCOME_LATE].player1 == '1000007'
+    assert singles[tdf.OUTCOME_LATE].table is None
+    assert singles[tdf.OUTCOME_BYE].player1 == '1000003'
+
+
+def test_path_file_and_bytes_agree():
+    with open(FIXTURE, 'rb') as f:
+        raw = f.read()
+        f.seek(0)
+        from_file = tdf.parse(f)
+    assert tdf.parse(raw) == tdf.parse(FIXTURE) == from_file
+
+
+def test_synthetic_event_matches_legacy_parser():
+    check_against_legacy(make_tdf(101, 7, seed=3))
@@ -0,0 +1,93 @@
+import numpy as np
+import os
+import random
+
+from benchmarks.tdf_parse import make_tdf
+from utils import tdf, tournament
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'tournament.tdf')
+DECKS = ['a', 'b', 'c', 'd', tournament.DEFAULT_DECK]
+
+
+def test_fixture_records():
+    model = tournament.TournamentModel.from_tdf(tdf.parse(FIXTURE))
+    records = {pid: model.record(model.player_index[pid]) for pid in model.player_ids}
+    assert records['1000001'] == '2-1-0'
+    assert records['1000003'] == '1-1-1'  # bye counts as a win
+    assert records['1000007'] == '0-2-0'  # late to round 1 counts as a loss
+    assert records['2000001'] == '1-0-1'
+    assert model.standings[2][:2] == [model.player_index['1000002'], model.player_index['1000004']]
+    assert model.places[model.player_index['1000007']] == 0
+
+
+def test_matchup_counts_match_a_plain_count():
+    parsed = tdf.parse(make_tdf(101, 7, seed=4))
+    model = tournament.TournamentModel.from_tdf(parsed)
+    rng = random.Random(0)
+    deck = {pid: rng.randrange(len(DECKS)) for pid in model.player_ids}
+    expected = np.zeros((len(DECKS), len(DECKS), 3), dtype=np.int32)
+    for m in parsed.matches:
+        if m.player2 is None:
+            continue
+        d1, d2 = deck[m.player1], deck[m.player2]
+        if m.outcome == tdf.OUTCOME_P1_WIN:
+            expected[d1, d2, tournament.WINS] += 1
+            expected[d2, d1, tournament.LOSSES] += 1
+        elif m.outcome == tdf.OUTCOME_P2_WIN:
+            expected[d1, d2, tournament.LOSSES] += 1
+            expected[d2, d1, tournament.WINS] += 1
+        elif m.outcome == tdf.OUTCOME_TIE:
+            expected[d1, d2, tournament.TIES] += 1
+            expected[d2, d1, tournament.TIES] += 1
+    deck_of = np.array([deck[pid] for pid in model.player_ids], dtype=np.int32)
+    assert (model.matchup_counts(deck_of, len(DECKS)) == expected).all()
+
+
+def full_rebuild(model, roster):
+    return tournament.MatchupAggregate(model).update(roster)
+
+
+def assert_same(got, expected):
+    got_ids, got_counts, got_per_deck = got
+    ids, counts, per_deck = expected
+    # decks can come in a different order, compare by id
+    order = [got_ids.index(d) for d in ids]
+    assert (got_counts[np.ix_(order, order)] == counts).all()
+    assert (got_per_deck[order] == per_deck).all()
+    # decks no longer in the roster keep an empty row and column
+    for d in set(got_ids) - set(ids):
+        i = got_ids.index(d)
+        assert got_counts[i].sum() == 0 and got_counts[:, i].sum() == 0
+
+
+def test_aggregate_matches_full_rebuild_one_change_at_a_time():
+    model = tournament.TournamentModel.from_tdf(tdf.parse(make_tdf(201, 8, seed=1)))
+    aggregate = tournament.MatchupAggregate(model)
+    rng = random.Random(0)
+    roster = {}
+    for _ in range(100):
+        roster[rng.choice(model.player_ids)] = rng.choice(DECKS)
+        assert_same(aggregate.update(roster), full_rebuild(model, roster))
+
+
+def test_aggregate_matches_full_rebuild_on_bulk_changes():
+    model = tournament.TournamentModel.from_tdf(tdf.parse(make_tdf(201, 8, seed=2)))
+    aggregate = tournament.MatchupAggregate(model)
+    rng = random.Random(1)
+    for _ in range(10):
+        roster = {p: rng.choice(DECKS) for p in model.player_ids if rng.random() < 0.8}
+        assert_same(aggregate.update(roster), full_rebuild(model, roster))
+    # and back to nobody assigned
+    assert_same(aggregate.update({}), full_rebuild(model, {}))
+
+
+def test_aggregate_counts_every_paired_match_from_both_sides():
+    model = tournament.TournamentModel.from_tdf(tdf.parse(FIXTURE))
+    roster = {pid: 'a' if i % 2 else 'b' for i, pid in enumerate(model.player_ids)}
+    deck_ids, counts, per_deck = tournament.MatchupAggregate(model).update(roster)
+    p1, _, outcome = model.paired
+    counted = np.isin(outcome, [tdf.OUTCOME_P1_WIN, tdf.OUTCOME_P2_WIN, tdf.OUTCOME_TIE])
+    assert counts.sum() == 2 * np.count_nonzero(counted)
+    # wins one way are losses the other
+    assert (counts[:, :, tournament.WINS] == counts[:, :, tournament.LOSSES].T).all()
+    assert per_deck.sum() == len(model.player_ids)
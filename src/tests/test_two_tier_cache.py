@@ -0,0 +1,89 @@
+import pytest
+from flask_caching.backends import FileSystemCache, SimpleCache
+
+from utils.cache_backends import TwoTierCache
+
+
+# keeps the stamp but refuses big values, like a size bounded backend
+class SmallValueCache(SimpleCache):
+    def set(self, key, value, timeout=None):
+        if isinstance(value, bytes) and len(value) > 1024:
+            return False
+        return super().set(key, value, timeout=timeout)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return FileSystemCache(str(tmp_path / 'cache'))
+
+
+# two workers sharing one backend, each with its own local tier
+@pytest.fixture
+def workers(backend):
+    return TwoTierCache(backend, revalidate=0), TwoTierCache(backend, revalidate=0)
+
+
+def test_write_is_seen_by_other_worker(workers):
+    a, b = workers
+    assert a.set('k', 'old')
+    assert b.get('k') == 'old'
+    assert a.set('k', 'new')
+    assert b.get('k') == 'new'
+
+
+def test_local_copy_kept_until_revalidate(backend):
+    a = TwoTierCache(backend, revalidate=0)
+    b = TwoTierCache(backend, revalidate=3600)
+    a.set('k', 'old')
+    assert b.get('k') == 'old'
+    a.set('k', 'new')
+    assert b.get('k') == 'old'
+
+
+def test_stamp_change_drops_local_copy(backend, workers):
+    a, b = workers
+    a.set('k', 'old')
+    assert b.get('k') == 'old'
+    backend.set('k', 'changed underneath')
+    backend.set('k.__stamp', 'another version')
+    assert b.get('k') == 'changed underneath'
+
+
+def test_delete_is_seen_by_other_worker(workers):
+    a, b = workers
+    a.set('k', 'v')
+    assert b.get('k') == 'v'
+    a.delete('k')
+    assert b.get('k') is None
+
+
+def test_get_many_mixes_local_and_backend(workers):
+    a, b = workers
+    a.set('x', 1)
+    b.set('y', 2)
+    assert a.get_many('x', 'y', 'z') == [1, 2, None]
+
+
+def test_partial_set_stores_nothing():
+    backend = SmallValueCache()
+    a, b = TwoTierCache(backend, revalidate=0), TwoTierCache(backend, revalidate=0)
+    a.set('k', 'old')
+    assert b.get('k') == 'old'
+    # the stamp is stored, the value is not
+    assert not a.set('k', b'x' * 2048)
+    assert a.get('k') is None
+    assert b.get('k') is None
+    assert backend.get('k') is None
+    assert backend.get('k.__stamp') is None
+
+
+def test_set_many_reports_failed_keys():
+    a = TwoTierCache(SmallValueCache(), revalidate=0)
+    assert a.set_many({'small': 1, 'huge': b'x' * 2048}) == ['small']
+
+
+def test_hit_is_a_copy(workers):
+    a, _ = workers
+    a.set('k', {'list': [1]})
+    a.get('k')['list'].append(2)
+    assert a.get('k') == {'list': [1]}
@@ -1,5 +1,16 @@
+import contextlib
+import fcntl
+import flask
 from flask_caching import Cache
+import functools
+import hashlib
+import json
 import os
+import pickle
+import threading
+import time
+
+from utils import metrics
 
 config = {
     "DEBUG": True,          # some Flask specific configs
@@ -12,8 +23,344 @@ if 'REDIS_URL' in os.environ:
     config['CACHE_KEY_PREFIX'] = 'flask_cache.'
     config['CACHE_REDIS_URL'] = os.environ['REDIS_URL']
 
+elif 'TH_SHM_CACHE_MB' in os.environ:
+    # Opt in for single host deployments, the workers share one mmap'd table
+    # in /dev/shm instead of files on disk. The pool is a fixed size set in
+    # MB by the variable and must fit the container's shm (docker's default
+    # is 64MB). When it fills, expired and then least recently used entries
+    # are evicted, values bigger than the pool are not stored. Every access
+    # holds an flock, which blocks the whole gevent worker, not just the
+    # calling greenlet, while another worker is reading or writing.
+    config['CACHE_TYPE'] = 'utils.cache_backends.SharedMemoryCache'
+    config['CACHE_SHM_PATH'] = '/dev/shm/th-cache'
+    config['CACHE_SHM_SIZE'] = int(os.environ['TH_SHM_CACHE_MB']) * 1024 * 1024
+
 else:
     config['CACHE_TYPE'] = 'FileSystemCache'
     config['CACHE_DIR'] = './.cache'
+    # the default of 500 files, twice over since TwoTierCache stores a stamp
+    # file next to every value, plus room for the card and lock entries
+    config['CACHE_THRESHOLD'] = 2000
+    # `add` is not atomic on files, cross worker locks flock these instead
+    config['CACHE_LOCK_DIR'] = './.cache-locks'
+
+# keep a hot copy of entries in each worker, see utils/cache_backends.py
+config['CACHE_BACKEND'] = config['CACHE_TYPE']
+config['CACHE_TYPE'] = 'utils.cache_backends.TwoTierCache'
+config['CACHE_LOCAL_MAX_ITEMS'] = 1024
+config['CACHE_LOCAL_MAX_BYTES'] = 64 * 1024 * 1024
+config['CACHE_LOCAL_REVALIDATE'] = 1
 
 cache = Cache(config=config)
+
+# every worker maps the same segment, its size is the same from any of them
+metrics.describe('th_shm_cache_entries', 'gauge', 'Entries in the shared memory cache.', merge='max')
+metrics.describe('th_shm_cache_free_bytes', 'gauge', 'Free data bytes in the shared memory cache.', merge='max')
+metrics.describe('th_shm_cache_evictions_total', 'counter', 'Entries evicted from the shared memory cache.')
+
+
+def _collect_backend():
+    backend = getattr(cache.cache, 'backend', None)
+    if not hasattr(backend, 'stats'):
+        return
+    stats = backend.stats()
+    metrics.set_gauge('th_shm_cache_entries', None, stats['entries'])
+    metrics.set_gauge('th_shm_cache_free_bytes', None, stats['free_bytes'])
+    metrics.set_counter('th_shm_cache_evictions_total', None, stats['evictions'])
+
+
+metrics.register_collector(_collect_backend)
+
+# how long a worker may hold the cross worker fetch lock, should be longer
+# than the slowest upstream call we expect
+SINGLE_FLIGHT_LOCK_TIMEOUT = 60
+# how long a finished fetch is kept around for workers that waited on it
+SINGLE_FLIGHT_RESULT_TIMEOUT = 60
+SINGLE_FLIGHT_POLL_INTERVAL = 0.1
+# only one worker refreshes a stale entry at a time
+SWR_REFRESH_LOCK_TIMEOUT = 60
+# after a failed refresh stale hits wait this long before trying again
+SWR_FAILURE_BACKOFF = 300
+
+
+_refreshing = threading.local()
+
+
+# Inside this block memoized functions that pass `forced_update=is_refreshing`
+# skip their cached value and store a fresh one, used by the cache warmer.
+@contextlib.contextmanager
+def refreshing():
+    _refreshing.active = True
+    try:
+        yield
+    finally:
+        _refreshing.active = False
+
+
+def is_refreshing():
+    return getattr(_refreshing, 'active', False)
+
+
+def make_key(f, args, kwargs):
+    name = f'{f.__module__}.{f.__qualname__}'
+    arguments = json.dumps([args, kwargs], sort_keys=True, default=repr)
+    return f'{name}.{hashlib.md5(arguments.encode("utf-8")).hexdigest()}'
+
+
+metrics.describe('th_cache_requests_total', 'counter', 'Memoized calls by function and result (hit, miss, stale).')
+metrics.describe('th_cache_fill_seconds', 'histogram', 'Time spent computing a memoized value on a miss.')
+metrics.describe('th_cache_entry_bytes', 'histogram', 'Pickled size of values stored by memoized functions.')
+
+
+def _function_name(f):
+    return f'{f.__module__}.{f.__qualname__}'
+
+
+def _record_fill(name, seconds, value):
+    metrics.observe('th_cache_fill_seconds', {'function': name}, seconds)
+    try:
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return
+    metrics.observe('th_cache_entry_bytes', {'function': name}, size, buckets=metrics.BYTES_BUCKETS)
+
+
+# `cache.memoize` that also counts hits and misses and records how long
+# misses take to fill and how big the stored values are, see /metrics.
+# Takes the same arguments, the cache keys are unchanged.
+def memoize(timeout=None, **kwargs):
+    def decorator(f):
+        name = _function_name(f)
+        filled = threading.local()
+
+        @functools.wraps(f)
+        def fill(*args, **kw):
+            start = time.perf_counter()
+            value = f(*args, **kw)
+            _record_fill(name, time.perf_counter() - start, value)
+            filled.active = True
+            return value
+
+        memoized = cache.memoize(timeout, **kwargs)(fill)
+
+        @functools.wraps(memoized)
+        def wrapper(*args, **kw):
+            filled.active = False
+            value = memoized(*args, **kw)
+            result = 'miss' if filled.active else 'hit'
+            metrics.inc('th_cache_requests_total', {'function': name, 'result': result})
+            return value
+        return wrapper
+    return decorator
+
+
+# A lock held by one worker at a time, taken without waiting. Redis and the
+# shared memory table do `add` atomically so the lock is a cache entry that
+# expires after `timeout` if its holder dies.
+class _CacheLock:
+    def __init__(self, key, timeout):
+        self.key = key
+        self.timeout = timeout
+
+    def acquire(self):
+        return cache.cache.add(self.key, True, timeout=self.timeout)
+
+    def locked(self):
+        return cache.cache.has(self.key)
+
+    def release(self):
+        cache.cache.delete(self.key)
+
+
+# FileSystemCache's `add` checks for the file and then writes it, two
+# workers can both get in. This flocks a file per key instead, the lock goes
+# away with its holder's process. The holder unlinks the file on release, a
+# worker that locked a file that has since been unlinked tries again.
+class _FileLock:
+    def __init__(self, key):
+        name = hashlib.md5(key.encode('utf-8')).hexdigest()
+        self.path = os.path.join(config['CACHE_LOCK_DIR'], f'{name}.lock')
+        self.file = None
+
+    def acquire(self):
+        os.makedirs(config['CACHE_LOCK_DIR'], exist_ok=True)
+        while True:
+            f = open(self.path, 'ab')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            try:
+                current = os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                self.file = f
+                return True
+            f.close()
+
+    def locked(self):
+        if self.file is not None:
+            return True
+        if self.acquire():
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        os.unlink(self.path)
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+
+# A lock only one worker on the host holds at a time, `acquire` does not
+# wait. `timeout` bounds how long a cache entry lock outlives a holder that
+# died, file locks go with the process.
+def worker_lock(key, timeout):
+    if 'CACHE_LOCK_DIR' in config:
+        return _FileLock(key)
+    return _CacheLock(key, timeout)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _fetch_across_workers(f, key, args, kwargs):
+    lock = worker_lock(f'single_flight.lock.{key}', SINGLE_FLIGHT_LOCK_TIMEOUT)
+    result_key = f'single_flight.result.{key}'
+    if lock.acquire():
+        try:
+            result = f(*args, **kwargs)
+            # wrapped in a tuple so a `None` result still reads as found
+            cache.cache.set(result_key, (result,), timeout=SINGLE_FLIGHT_RESULT_TIMEOUT)
+            return result
+        finally:
+            lock.release()
+
+    # another worker is already fetching, wait for it to publish
+    deadline = time.monotonic() + SINGLE_FLIGHT_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        published = cache.cache.get(result_key)
+        if published is not None:
+            return published[0]
+        if not lock.locked():
+            break
+    return f(*args, **kwargs)
+
+
+# Collapse concurrent calls with the same arguments into one call. Sits
+# underneath `cache.memoize` so when an entry expires only one greenlet per
+# worker, and one worker across workers, goes upstream while the rest wait.
+def single_flight(f):
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        key = make_key(f, args, kwargs)
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                _flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = _fetch_across_workers(f, key, args, kwargs)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with _flights_lock:
+                _flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+    return wrapper
+
+
+# Like `cache.memoize(timeout)` but once `timeout` passes the old value is
+# still served for up to `stale_for` seconds while a background greenlet
+# fetches the new one, so nobody waits on upstream after the first fill.
+def memoize_swr(timeout, stale_for):
+    def decorator(f):
+        name = _function_name(f)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            value = f(*args, **kwargs)
+            _record_fill(name, time.perf_counter() - start, value)
+            return value
+        fetch = single_flight(functools.wraps(f)(timed))
+
+        def store(key, value):
+            entry = {'value': value, 'fresh_until': time.time() + timeout}
+            cache.cache.set(key, entry, timeout=timeout + stale_for)
+
+        def refresh_in_background(key, args, kwargs):
+            # the refresh runs in the app's context, without one the stale
+            # value is served as is
+            if not flask.has_app_context():
+                return
+            backoff_key = f'swr.backoff.{key}'
+            if cache.cache.get(backoff_key) is not None:
+                return
+            lock = worker_lock(f'swr.refresh.{key}', SWR_REFRESH_LOCK_TIMEOUT)
+            if not lock.acquire():
+                return
+            app = flask.current_app._get_current_object()
+
+            def run():
+                try:
+                    with app.app_context():
+                        try:
+                            store(key, fetch(*args, **kwargs))
+                        except Exception:
+                            app.logger.exception('Error refreshing %s, retrying in %ss', name, SWR_FAILURE_BACKOFF)
+                            cache.cache.set(backoff_key, True, timeout=SWR_FAILURE_BACKOFF)
+                finally:
+                    lock.release()
+
+            try:
+                threading.Thread(target=run, daemon=True).start()
+            except Exception:
+                lock.release()
+                raise
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            key = f'swr.{make_key(f, args, kwargs)}'
+            entry = cache.cache.get(key)
+            if entry is None:
+                metrics.inc('th_cache_requests_total', {'function': name, 'result': 'miss'})
+                value = fetch(*args, **kwargs)
+                store(key, value)
+                return value
+            if time.time() >= entry['fresh_until']:
+                metrics.inc('th_cache_requests_total', {'function': name, 'result': 'stale'})
+                refresh_in_background(key, args, kwargs)
+            else:
+                metrics.inc('th_cache_requests_total', {'function': name, 'result': 'hit'})
+            return entry['value']
+
+        def refresh(*args, **kwargs):
+            value = timed(*args, **kwargs)
+            store(f'swr.{make_key(f, args, kwargs)}', value)
+            return value
+
+        wrapper.refresh = refresh
+        return wrapper
+    return decorator
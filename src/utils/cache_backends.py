@@ -0,0 +1,439 @@
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import numpy as np
+import os
+import pickle
+import threading
+import time
+import uuid
+
+from flask_caching.backends.base import BaseCache
+from werkzeug.utils import import_string
+
+from utils import lru
+
+
+def _backend_class(name):
+    if '.' not in name:
+        name = f'flask_caching.backends.{name}'
+    return import_string(name)
+
+
+# A per-process LRU in front of a shared backend (FileSystemCache or Redis).
+#
+# Every value written through this cache gets a random stamp stored next to
+# it in the backend. Local entries are served straight from memory for
+# `revalidate` seconds, after that the stamp is read back and the entry is
+# kept only while it still matches, so a write or delete from another worker
+# is picked up within `revalidate` seconds without re-reading the value.
+# Values are held pickled, every hit hands out a fresh copy just like the
+# shared backend does, and the pickled size is what `max_bytes` bounds.
+#
+# Locks (`add`, `has`) always go to the backend.
+class TwoTierCache(BaseCache):
+    def __init__(self, backend, default_timeout=300, max_items=1024, max_bytes=64 * 1024 * 1024,
+                 local_timeout=300, revalidate=1):
+        super().__init__(default_timeout=default_timeout)
+        self.backend = backend
+        self.local_timeout = local_timeout
+        self.revalidate = revalidate
+        self.local = lru.LRUCache('two_tier_local', maxsize=max_items, maxbytes=max_bytes)
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        backend_class = _backend_class(config['CACHE_BACKEND'])
+        backend = backend_class.factory(app, config, list(args), dict(kwargs))
+        return cls(
+            backend,
+            default_timeout=kwargs.get('default_timeout', 300),
+            max_items=config.get('CACHE_LOCAL_MAX_ITEMS', 1024),
+            max_bytes=config.get('CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024),
+            local_timeout=config.get('CACHE_LOCAL_TIMEOUT', 300),
+            revalidate=config.get('CACHE_LOCAL_REVALIDATE', 1),
+        )
+
+    @staticmethod
+    def _stamp_key(key):
+        return f'{key}.__stamp'
+
+    def _remember(self, key, value, stamp, timeout):
+        if value is None or stamp is None:
+            return
+        now = time.monotonic()
+        lifetime = self.local_timeout if not timeout else min(timeout, self.local_timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.local.set(key, (data, stamp, now + lifetime, now + self.revalidate), size=len(data))
+
+    def _local_get(self, key):
+        entry = self.local.get(key)
+        if entry is None:
+            return None
+        data, stamp, expires, revalidate_at = entry
+        now = time.monotonic()
+        if now >= expires:
+            self.local.delete(key)
+            return None
+        if now >= revalidate_at:
+            if self.backend.get(self._stamp_key(key)) != stamp:
+                self.local.delete(key)
+                return None
+            self.local.set(key, (data, stamp, expires, now + self.revalidate), size=len(data))
+        return pickle.loads(data)
+
+    def get(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        value, stamp = self.backend.get_many(key, self._stamp_key(key))
+        self._remember(key, value, stamp, None)
+        return value
+
+    def get_many(self, *keys):
+        values = [self._local_get(k) for k in keys]
+        missing = [k for k, v in zip(keys, values) if v is None]
+        if missing:
+            fetched = self.backend.get_many(*(k for m in missing for k in (m, self._stamp_key(m))))
+            found = {}
+            for i, key in enumerate(missing):
+                value, stamp = fetched[2 * i], fetched[2 * i + 1]
+                self._remember(key, value, stamp, None)
+                found[key] = value
+            values = [found[k] if v is None else v for k, v in zip(keys, values)]
+        return values
+
+    def set(self, key, value, timeout=None):
+        stamp = uuid.uuid4().hex
+        timeout = self._normalize_timeout(timeout)
+        stored = self.backend.set_many({key: value, self._stamp_key(key): stamp}, timeout=timeout)
+        if key not in stored or self._stamp_key(key) not in stored:
+            # the backend can keep one half (an oversized value next to its
+            # stamp), drop both so no worker pairs a stamp with a stale value
+            self.local.delete(key)
+            self.backend.delete_many(key, self._stamp_key(key))
+            return False
+        self._remember(key, value, stamp, timeout)
+        return True
+
+    def set_many(self, mapping, timeout=None):
+        failed = []
+        for key, value in mapping.items():
+            if not self.set(key, value, timeout=timeout):
+                failed.append(key)
+        return [k for k in mapping if k not in failed]
+
+    def add(self, key, value, timeout=None):
+        return self.backend.add(key, value, timeout=timeout)
+
+    def has(self, key):
+        return self.backend.has(key)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.backend.delete(self._stamp_key(key))
+        return self.backend.delete(key)
+
+    def delete_many(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+        self.backend.delete_many(*(k for key in keys for k in (key, self._stamp_key(key))))
+        return list(keys)
+
+    def inc(self, key, delta=1):
+        self.local.delete(key)
+        return self.backend.inc(key, delta=delta)
+
+    def dec(self, key, delta=1):
+        self.local.delete(key)
+        return self.backend.dec(key, delta=delta)
+
+    def clear(self):
+        self.local.clear()
+        return self.backend.clear()
+
+
+SHM_MAGIC = 0x54485348_4d303031  # "THSHM001"
+SHM_HEADER = 8
+# header fields, stored as int64
+_MAGIC, _SLOTS, _BLOCKS, _BLOCK_SIZE, _FREE_HEAD, _FREE_COUNT, _CLOCK = range(7)
+_EMPTY, _USED, _DELETED = 0, 1, 2
+SLOT_DTYPE = np.dtype([
+    ('h1', '<u8'), ('h2', '<u8'),
+    ('head', '<i8'), ('length', '<i8'),
+    ('expires', '<f8'), ('used', '<i8'),
+    ('state', '<i8'),
+])
+
+
+# A size-bounded cache shared by every worker on the host, kept in one
+# mmap'd file in /dev/shm.
+#
+# The file holds a header, an open addressing table of `slots` keyed by a
+# 128 bit hash of the cache key, a next-block table and the data blocks.
+# A value is pickled into a chain of fixed size blocks. When blocks or
+# slots run out, expired entries go first and then the least recently used
+# ones, tracked by a shared clock bumped on every hit.
+#
+# Every operation holds an flock on a sidecar lock file, plus a thread lock
+# since flock does not exclude greenlets of the same process. Lock files are
+# reopened after a fork so preloaded workers do not share one lock.
+class SharedMemoryCache(BaseCache):
+    def __init__(self, path, size=48 * 1024 * 1024, slots=8192, block_size=4096, default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.block_size = block_size
+        self.n_slots = slots
+        meta = SHM_HEADER * 8 + slots * SLOT_DTYPE.itemsize
+        blocks_start = -(-(meta + 4 * (size // block_size)) // block_size) * block_size
+        self.n_blocks = (size - blocks_start) // block_size
+        if self.n_blocks <= 0:
+            raise ValueError(f'{size} bytes is too small for {slots} slots')
+        self.size = blocks_start + self.n_blocks * block_size
+
+        self.evictions = 0
+        self._thread_lock = threading.RLock()
+        self._lock_pid = None
+        self._lock_file = None
+
+        with self._locked():
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size != self.size:
+                    os.ftruncate(fd, self.size)
+                self._map = mmap.mmap(fd, self.size, mmap.MAP_SHARED)
+            finally:
+                os.close(fd)
+
+        offset = 0
+        self._header = np.ndarray((SHM_HEADER,), dtype='<i8', buffer=self._map, offset=offset)
+        offset += SHM_HEADER * 8
+        self._slots = np.ndarray((slots,), dtype=SLOT_DTYPE, buffer=self._map, offset=offset)
+        offset += slots * SLOT_DTYPE.itemsize
+        self._next = np.ndarray((self.n_blocks,), dtype='<i4', buffer=self._map, offset=offset)
+        self._blocks_start = blocks_start
+
+        with self._locked():
+            if (self._header[_MAGIC] != SHM_MAGIC or self._header[_SLOTS] != slots
+                    or self._header[_BLOCKS] != self.n_blocks or self._header[_BLOCK_SIZE] != block_size):
+                self._reset()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(
+            config.get('CACHE_SHM_PATH', '/dev/shm/th-cache'),
+            size=config.get('CACHE_SHM_SIZE', 48 * 1024 * 1024),
+            slots=config.get('CACHE_SHM_SLOTS', 8192),
+            default_timeout=kwargs.get('default_timeout', 300),
+        )
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if self._lock_pid != os.getpid():
+                self._lock_file = open(f'{self.path}.lock', 'a')
+                self._lock_pid = os.getpid()
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    # -- table, all called with the lock held --
+
+    def _reset(self):
+        self._slots[:] = np.zeros(1, dtype=SLOT_DTYPE)
+        self._next[:-1] = np.arange(1, self.n_blocks, dtype='<i4')
+        self._next[-1] = -1
+        self._header[:] = 0
+        self._header[_SLOTS] = self.n_slots
+        self._header[_BLOCKS] = self.n_blocks
+        self._header[_BLOCK_SIZE] = self.block_size
+        self._header[_FREE_HEAD] = 0
+        self._header[_FREE_COUNT] = self.n_blocks
+        self._header[_MAGIC] = SHM_MAGIC
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+    def _find(self, h1, h2):
+        # returns (slot holding the key or None, first reusable slot)
+        i = h1 % self.n_slots
+        reusable = None
+        for _ in range(self.n_slots):
+            slot = self._slots[i]
+            state = slot['state']
+            if state == _EMPTY:
+                return None, i if reusable is None else reusable
+            if state == _USED and slot['h1'] == h1 and slot['h2'] == h2:
+                return i, None
+            if state == _DELETED and reusable is None:
+                reusable = i
+            i = (i + 1) % self.n_slots
+        return None, reusable
+
+    def _live(self, i):
+        expires = self._slots[i]['expires']
+        return expires == 0 or expires > time.time()
+
+    def _free(self, i):
+        block = int(self._slots[i]['head'])
+        count = 0
+        tail = block
+        while block != -1:
+            tail = block
+            count += 1
+            block = int(self._next[block])
+        if count:
+            self._next[tail] = self._header[_FREE_HEAD]
+            self._header[_FREE_HEAD] = self._slots[i]['head']
+            self._header[_FREE_COUNT] += count
+        self._slots['state'][i] = _DELETED
+
+    def _evict_expired(self):
+        used = self._slots['state'] == _USED
+        expires = self._slots['expires']
+        for i in np.nonzero(used & (expires != 0) & (expires <= time.time()))[0]:
+            self._free(int(i))
+            self.evictions += 1
+
+    def _evict_lru(self, count=1):
+        used = np.nonzero(self._slots['state'] == _USED)[0]
+        oldest = used[np.argsort(self._slots['used'][used])[:count]]
+        for i in oldest:
+            self._free(int(i))
+        self.evictions += len(oldest)
+        return len(oldest)
+
+    def _rehash(self):
+        entries = self._slots[self._slots['state'] == _USED].copy()
+        self._slots[:] = np.zeros(1, dtype=SLOT_DTYPE)
+        for entry in entries:
+            _, i = self._find(int(entry['h1']), int(entry['h2']))
+            self._slots[i] = entry
+
+    def _tick(self):
+        self._header[_CLOCK] += 1
+        return self._header[_CLOCK]
+
+    def _read(self, i):
+        slot = self._slots[i]
+        remaining = int(slot['length'])
+        block = int(slot['head'])
+        chunks = []
+        while remaining > 0:
+            start = self._blocks_start + block * self.block_size
+            n = min(remaining, self.block_size)
+            chunks.append(self._map[start:start + n])
+            remaining -= n
+            block = int(self._next[block])
+        return b''.join(chunks)
+
+    def _write(self, key, data, expires, only_new=False):
+        needed = max(1, -(-len(data) // self.block_size))
+        if needed > self.n_blocks:
+            return False
+        h1, h2 = self._hash(key)
+        found, _ = self._find(h1, h2)
+        if found is not None:
+            if only_new and self._live(found):
+                return False
+            self._free(found)
+
+        if self._header[_FREE_COUNT] < needed:
+            self._evict_expired()
+        while self._header[_FREE_COUNT] < needed:
+            if not self._evict_lru():
+                return False
+        # keep probe chains short, drop tombstones and thin out the table
+        # once it is nearly full
+        if np.count_nonzero(self._slots['state'] != _EMPTY) >= self.n_slots * 0.9:
+            self._evict_expired()
+            excess = np.count_nonzero(self._slots['state'] == _USED) - int(self.n_slots * 0.75)
+            if excess > 0:
+                self._evict_lru(excess)
+            self._rehash()
+
+        head = int(self._header[_FREE_HEAD])
+        block = head
+        for n in range(needed):
+            start = self._blocks_start + block * self.block_size
+            chunk = data[n * self.block_size:(n + 1) * self.block_size]
+            self._map[start:start + len(chunk)] = chunk
+            if n == needed - 1:
+                following = int(self._next[block])
+                self._next[block] = -1
+                block = following
+            else:
+                block = int(self._next[block])
+        self._header[_FREE_HEAD] = block
+        self._header[_FREE_COUNT] -= needed
+
+        _, i = self._find(h1, h2)
+        self._slots[i] = (h1, h2, head, len(data), expires, self._tick(), _USED)
+        return True
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return 0 if timeout == 0 else time.time() + timeout
+
+    # -- cache api --
+
+    def get(self, key):
+        with self._locked():
+            i, _ = self._find(*self._hash(key))
+            if i is None:
+                return None
+            if not self._live(i):
+                self._free(i)
+                return None
+            self._slots['used'][i] = self._tick()
+            data = self._read(i)
+        return pickle.loads(data)
+
+    def get_many(self, *keys):
+        return [self.get(k) for k in keys]
+
+    def set(self, key, value, timeout=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._locked():
+            return self._write(key, data, self._expires(timeout))
+
+    def set_many(self, mapping, timeout=None):
+        return [k for k, v in mapping.items() if self.set(k, v, timeout=timeout)]
+
+    def add(self, key, value, timeout=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._locked():
+            return self._write(key, data, self._expires(timeout), only_new=True)
+
+    def has(self, key):
+        with self._locked():
+            i, _ = self._find(*self._hash(key))
+            return i is not None and self._live(i)
+
+    def delete(self, key):
+        with self._locked():
+            i, _ = self._find(*self._hash(key))
+            if i is None:
+                return False
+            self._free(i)
+            return True
+
+    def delete_many(self, *keys):
+        return [k for k in keys if self.delete(k)]
+
+    def clear(self):
+        with self._locked():
+            self._reset()
+        return True
+
+    def stats(self):
+        with self._locked():
+            return {
+                'entries': int(np.count_nonzero(self._slots['state'] == _USED)),
+                'free_bytes': int(self._header[_FREE_COUNT]) * self.block_size,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import sqlite3
+
+import th_helpers.utils.card_cache
+import th_helpers.utils.cards
+
+SNAPSHOT_PATH = os.environ.get('CARD_SNAPSHOT_PATH', './data/cards.sqlite')
+# the whole snapshot is a few MB, map all of it so reads are page cache hits
+# shared by every worker instead of per worker copies
+MMAP_SIZE = 256 * 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE sets (
+    ptcgo_code TEXT PRIMARY KEY,
+    set_id TEXT NOT NULL
+);
+CREATE TABLE cards (
+    card_id TEXT PRIMARY KEY,
+    set_id TEXT NOT NULL,
+    number TEXT NOT NULL,
+    name TEXT NOT NULL,
+    supertype TEXT,
+    subtype TEXT,
+    dex INTEGER,
+    attacks TEXT
+);
+CREATE INDEX cards_card_code ON cards (set_id, number);
+CREATE INDEX cards_name ON cards (name);
+'''
+
+# one read-only connection per process, opened on first use. Not thread or
+# greenlet local, under gevent that would open one per request.
+_conn = None
+_conn_pid = None
+_available = None
+
+
+def _card_row(card_id, card):
+    set_id, number = card_id.rsplit('-', 1)
+    subtypes = card.get('subtypes') or [None]
+    nat_dex = card.get('nationalPokedexNumbers')
+    attacks = card.get('attacks', []) if card.get('supertype') == 'Pokémon' else None
+    return (
+        card_id, set_id, number, card.get('name'),
+        card.get('supertype'),
+        subtypes[0] if 'Pokémon Tool' not in subtypes else 'Pokémon Tool',
+        nat_dex[0] if nat_dex else None,
+        None if attacks is None else json.dumps(attacks)
+    )
+
+
+# Write a fresh snapshot of the card data next to `path` and swap it in, so
+# running workers keep reading the old file until they restart.
+def build(path=SNAPSHOT_PATH):
+    th_helpers.utils.card_cache.ensure_loaded()
+    sets = th_helpers.utils.card_cache.get_all_sets_map()
+    # there is no public accessor for every card, `ensure_loaded` always
+    # leaves the flat {card_id: card} index it loaded on disk
+    with open(th_helpers.utils.card_cache.INDEX_PATH, encoding='utf-8') as f:
+        cards = json.load(f)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany('INSERT INTO sets VALUES (?, ?)', [(code, s['id']) for code, s in sets.items()])
+        conn.executemany(
+            'INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [_card_row(card_id, card) for card_id, card in cards.items() if '-' in card_id]
+        )
+        conn.commit()
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return len(sets), len(cards)
+
+
+# checked once per process, a snapshot built later is picked up on restart
+def available():
+    global _available
+    if _available is None:
+        _available = os.path.isfile(SNAPSHOT_PATH)
+    return _available
+
+
+def _connection():
+    global _conn, _conn_pid
+    # a connection opened before the fork is not carried into the workers
+    if _conn is None or _conn_pid != os.getpid():
+        uri = f'file:{os.path.abspath(SNAPSHOT_PATH)}?mode=ro&immutable=1'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        _conn, _conn_pid = conn, os.getpid()
+    return _conn
+
+
+def _set_id(conn, code):
+    if code is None:
+        return None
+    # same alias the card data lookup applies
+    code = 'PR-SV' if code == 'SVP' else code
+    row = conn.execute('SELECT set_id FROM sets WHERE ptcgo_code = ?', (code.strip().upper(),)).fetchone()
+    return row[0] if row else None
+
+
+# Same fields `th_helpers.utils.cards.get_card` fills in, read from the
+# snapshot. Unlike that lookup, Pokémon keep the printing they were asked
+# for instead of the first printing with matching attacks, decklists still
+# group reprints through the attack hash in their `unique`.
+def get_card(name, set, number):
+    conn = _connection()
+    card = {'name': name, 'set': set, 'number': number}
+    row = conn.execute(
+        'SELECT supertype, subtype, dex, attacks FROM cards WHERE set_id = ? AND number = ?',
+        (_set_id(conn, set), number)
+    ).fetchone()
+    if row is None:
+        basic_energy = not any(c.isdigit() for c in number) or ('Energy' in name and name.split(' ')[0] in th_helpers.utils.cards.ENERGY)
+        card['supertype'] = 'Energy' if basic_energy else None
+        card['subtype'] = 'Basic' if basic_energy else None
+        card['dex'] = None
+        return card
+    supertype, subtype, dex, attacks = row
+    card['supertype'] = supertype
+    card['subtype'] = subtype
+    card['dex'] = dex
+    if supertype == 'Pokémon':
+        card['attacks'] = json.loads(attacks)
+    return card
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the read-only card snapshot the app looks cards up in.')
+    parser.add_argument('--path', default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+    n_sets, n_cards = build(args.path)
+    print(f'Wrote {n_cards} cards and {n_sets} sets to {args.path}')
@@ -1,10 +1,68 @@
 import th_helpers.utils.cards
 
-from utils import cache
+from utils import cache, card_db, lru
 
+CARD_TIMEOUT = 604800
+# stored for identities the card data has nothing for, both cache tiers
+# read `None` as a miss. A plain value so it survives the shared cache.
+NOT_FOUND = 'cards.not_found'
 
-@cache.cache.memoize(timeout=604800)
+# per process tier in front of the shared cache, card metadata never changes
+# for a given identity so entries only leave through eviction
+local_cards = lru.LRUCache('cards', maxsize=8192)
+
+
+def _card_key(set, number, name):
+    return f'cards.{set}.{number}.{name}'
+
+
+# Look up the metadata for many (set, number, name) identities at once.
+# Hits come from this process first. With a card snapshot built (see
+# `utils.card_db`) the rest are local index reads, otherwise they come from
+# the shared cache in a single round-trip and only what is still missing
+# goes to the card data. Every card returned is a fresh copy, so callers
+# can add their own fields.
+def get_many(identities):
+    identities = list(dict.fromkeys(identities))
+    cards = {}
+    remote = []
+    for identity in identities:
+        card = local_cards.get(identity)
+        if card is None:
+            remote.append(identity)
+        else:
+            cards[identity] = None if card == NOT_FOUND else card
+
+    if card_db.available():
+        for identity in remote:
+            set, number, name = identity
+            card = card_db.get_card(name, set, number)
+            local_cards.set(identity, NOT_FOUND if card is None else card)
+            cards[identity] = card
+        remote = []
+
+    keys = [_card_key(*i) for i in remote]
+    found = cache.cache.get_many(*keys) if keys else []
+    missing = {}
+    for identity, key, card in zip(remote, keys, found):
+        if card is None:
+            set, number, name = identity
+            card = th_helpers.utils.cards.get_card(name, set, number)
+            missing[key] = NOT_FOUND if card is None else card
+        elif card == NOT_FOUND:
+            card = None
+        local_cards.set(identity, NOT_FOUND if card is None else card)
+        cards[identity] = card
+    if missing:
+        cache.cache.set_many(missing, timeout=CARD_TIMEOUT)
+    return {identity: None if card is None else dict(card) for identity, card in cards.items()}
+
+
+def card_identity(card):
+    return (card['set'], card['number'], card['name'])
+
+
+# Returns `card` with its metadata filled in, `card` itself is left as is.
 def get_card(card):
-    fetched_card = th_helpers.utils.cards.get_card(card['name'], card['set'], card['number'])
-    card.update(fetched_card)
-    return card
+    key = card_identity(card)
+    return {**card, **get_many([key])[key]}
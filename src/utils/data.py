@@ -1,10 +1,21 @@
+import collections
+import concurrent.futures
 import datetime
+import functools
+import json
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
+import requests.adapters
 import requests_cache
+import urllib.parse
 
 import utils.cache
 import utils.constants as c
+import utils.metrics
+import utils.profiling
 
 load_dotenv()
 
@@ -15,17 +26,195 @@ api_url = f'{BASE_URL}/api'
 analysis_url = f'{BASE_URL}/analysis'
 api_key = {'x-api-key': os.environ['TRAINER_HILL_API_KEY']}
 
-session = requests_cache.CachedSession(expire_after=datetime.timedelta(1), backend='filesystem', cache_name='.session-cache')
+logger = logging.getLogger(__name__)
+
+# number of upstream calls a worker will run at once, also used as the
+# size of the keep-alive connection pool so batched calls reuse sockets
+MAX_CONCURRENT_REQUESTS = 8
+
+# path segments that are part of an endpoint's name, anything else (deck
+# ids, card codes) is a parameter and gets collapsed in metric labels
+ENDPOINT_SEGMENTS = {
+    'api', 'analysis', 'meta', 'breakdown', 'matchups', 'cards', 'core', 'decks',
+    'decklists', 'skeleton-counts', 'trend', 'card-matchups',
+}
+
+utils.metrics.describe('th_upstream_requests_total', 'counter', 'Upstream API calls by endpoint, status code and whether the session cache answered.')
+utils.metrics.describe('th_upstream_request_seconds', 'histogram', 'Upstream API call latency by endpoint and whether the session cache answered.')
+utils.metrics.describe('th_upstream_response_bytes', 'histogram', 'Upstream API response body size by endpoint.')
+utils.metrics.describe('th_session_cache_responses', 'gauge', 'Responses stored in the requests_cache session cache.', merge='max')
+
+
+def endpoint_name(url):
+    path = urllib.parse.urlsplit(url).path
+    return '/'.join(p if p in ENDPOINT_SEGMENTS or p == '' else '{}' for p in path.split('/'))
+
+
+# Every call is timed and counted by endpoint, status and cache, so a slow
+# or failing upstream shows on /metrics instead of as an empty figure.
+class InstrumentedSession(requests_cache.CachedSession):
+    def request(self, method, url, *args, **kwargs):
+        endpoint = endpoint_name(url)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception as e:
+            utils.metrics.inc('th_upstream_requests_total', {'endpoint': endpoint, 'status': type(e).__name__, 'cache': 'miss'})
+            raise
+        elapsed = time.perf_counter() - start
+        labels = {'endpoint': endpoint, 'cache': 'hit' if getattr(response, 'from_cache', False) else 'miss'}
+        utils.metrics.observe('th_upstream_request_seconds', labels, elapsed)
+        utils.metrics.inc('th_upstream_requests_total', {**labels, 'status': str(response.status_code)})
+        utils.metrics.observe('th_upstream_response_bytes', {'endpoint': endpoint}, len(response.content), buckets=utils.metrics.BYTES_BUCKETS)
+        if response.status_code != 200 and not getattr(response, 'from_cache', False):
+            print(f'Upstream {method} {endpoint} returned {response.status_code} after {elapsed:.2f}s')
+        return response
+
+
+# The analysis endpoints are POSTs, their parameters go in the query string
+# so they are part of the cache key like a GET's. Their responses are only
+# kept long enough for a prefetch or the warmer to hand them to the callback
+# that asks next, the callbacks reading them unmemoized stay this fresh and
+# the memoized ones are not stretched past their own timeout by much.
+ANALYSIS_CACHE_EXPIRE = datetime.timedelta(hours=1)
+session = InstrumentedSession(
+    expire_after=datetime.timedelta(1),
+    urls_expire_after={f'{analysis_url}/*': ANALYSIS_CACHE_EXPIRE},
+    backend='filesystem',
+    cache_name='.session-cache',
+    allowable_methods=('GET', 'HEAD', 'POST'),
+)
 session.headers.update(api_key)
+_adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_CONCURRENT_REQUESTS, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+session.mount('https://', _adapter)
+session.mount('http://', _adapter)
 
+# threads are greenlets once gevent has monkey patched the worker
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix='th-api')
 
-@utils.cache.cache.memoize(c.TIME.HALF_DAY)
-def get_decks(tour_filter):
-    url = f'{api_url}/decks'
-    r = session.get(url, params=tour_filter)
-    content = []
+
+def _collect_session_cache():
+    utils.metrics.set_gauge('th_session_cache_responses', None, len(session.cache.responses))
+
+
+utils.metrics.register_collector(_collect_session_cache)
+
+
+# requests_cache only replaces an expired response when the same request is
+# made again, drop the rest so the cache stays at about a day of requests
+def purge_session_cache():
+    session.cache.delete(expired=True)
+
+
+APIRequest = collections.namedtuple('APIRequest', ['method', 'url', 'params'])
+
+
+# prefetches still running, by request
+_prefetching = {}
+_prefetching_lock = threading.Lock()
+
+
+def _request_key(request):
+    return json.dumps([request.method, request.url, request.params], sort_keys=True, default=repr)
+
+
+def _send(request, refresh=False):
+    return session.request(request.method, request.url, params=request.params, force_refresh=refresh)
+
+
+def fetch(request, refresh=False):
+    refresh = refresh or utils.cache.is_refreshing()
+    start = time.perf_counter()
+    r = None
+    if not refresh:
+        with _prefetching_lock:
+            prefetched = _prefetching.get(_request_key(request))
+        if prefetched is not None:
+            # the prefetch already went upstream, wait for it instead, if it
+            # failed send the request again
+            try:
+                r = prefetched.result()
+            except Exception:
+                pass
+    if r is None:
+        r = _send(request, refresh)
+    utils.profiling.add_upstream_time(time.perf_counter() - start)
     if r.status_code == 200:
-        content = r.json()
+        return r.json()
+    return None
+
+
+# `requests` maps a caller chosen key to an `APIRequest`, results come back
+# under the same keys once every request has finished (`None` for non-200s)
+def fetch_many(requests, refresh=False):
+    start = time.perf_counter()
+    futures = {key: _executor.submit(fetch, request, refresh) for key, request in requests.items()}
+    results = {key: future.result() for key, future in futures.items()}
+    # the pool threads have no request context, count the wait here instead
+    utils.profiling.add_upstream_time(time.perf_counter() - start)
+    return results
+
+
+def _prefetched(key, future):
+    with _prefetching_lock:
+        _prefetching.pop(key, None)
+    error = future.exception()
+    if error is not None:
+        logger.warning('Prefetch of %s failed: %r', key, error)
+
+
+# Start requests a later callback will make. A `fetch` of a request still
+# in flight waits on it, one that already finished finds the response in
+# the session cache, either way it is not sent upstream twice.
+def prefetch(requests):
+    for request in requests:
+        key = _request_key(request)
+        with _prefetching_lock:
+            if key in _prefetching:
+                continue
+            future = _executor.submit(_send, request)
+            _prefetching[key] = future
+        future.add_done_callback(functools.partial(_prefetched, key))
+
+
+def breakdown_request(tour_data, placing=None):
+    params = tour_data.copy()
+    params['placement'] = placing if placing is not None else 10_000
+    return APIRequest('POST', f'{analysis_url}/meta/breakdown', params)
+
+
+def card_options_request(tf):
+    return APIRequest('GET', f'{api_url}/cards/{tf["deck"]}', tf)
+
+
+def skeleton_request(tf):
+    params = tf.copy()
+    if 'include' in tf:
+        params['include_card'] = tf['include']
+    if 'exclude' in tf:
+        params['exclude_card'] = tf['exclude']
+    params['granularity'] = tf['granularity']
+    return APIRequest('POST', f'{analysis_url}/decklists/{tf["deck"]}/skeleton-counts', params)
+
+
+def card_trend_request(tf):
+    return APIRequest('POST', f'{analysis_url}/decklists/{tf["deck"]}/trend/{tf["selected_card"]}', tf)
+
+
+# the archetypes the decklist page compares against before the user picks any
+def default_against_archetypes(decks, deck):
+    return [d['id'] for d in decks if d['id'] not in ['other', deck]][:15]
+
+
+def card_matchups_request(tf, against, card='overall'):
+    params = tf.copy()
+    params['against_archetypes'] = against
+    return APIRequest('POST', f'{analysis_url}/decklists/{tf["deck"]}/card-matchups/{card}', params)
+
+
+@utils.cache.memoize_swr(c.TIME.HALF_DAY, stale_for=c.TIME.DAY * 7)
+def get_decks(tour_filter):
+    content = fetch(APIRequest('GET', f'{api_url}/decks', tour_filter)) or []
     decks = []
     ids = set()
     for c in content:
@@ -37,27 +226,26 @@ def get_decks(tour_filter):
     return decks
 
 
-@utils.cache.cache.memoize(c.TIME.HALF_DAY)
+@utils.cache.memoize(c.TIME.HALF_DAY, forced_update=utils.cache.is_refreshing)
+@utils.cache.single_flight
 def fetch_matchup_data(tour_data, decks):
     params = tour_data.copy()
     params['games_played'] = 5
     params['archetypes'] = decks
     params['ids_only'] = True
-    url = f'{analysis_url}/meta/matchups'
-    r = session.post(url, params=params)
-    if r.status_code == 200:
-        return r.json()['data']
+    resp = fetch(APIRequest('POST', f'{analysis_url}/meta/matchups', params))
+    if resp is not None:
+        return resp['data']
     return []
 
 
-@utils.cache.cache.memoize(c.TIME.HALF_DAY)
+@utils.cache.memoize(c.TIME.HALF_DAY, forced_update=utils.cache.is_refreshing)
+@utils.cache.single_flight
 def fetch_core_cards(params):
-    url = f'{analysis_url}/cards/core'
-    r = session.post(url, params=params)
+    resp = fetch(APIRequest('POST', f'{analysis_url}/cards/core', params))
     cards = []
     total = 0
-    if r.status_code == 200:
-        resp = r.json()
+    if resp is not None:
         cards = resp['data']
         total = resp['total']
     return cards, total
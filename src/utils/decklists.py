@@ -3,6 +3,11 @@ import hashlib
 import th_helpers.utils.cards
 
 import utils.cards
+import utils.lru
+
+# `unique` only depends on the card itself, so it is worked out once per
+# card_code instead of once per card per decklist
+unique_cache = utils.lru.LRUCache('card_unique', maxsize=4096)
 
 
 def _parse_decklist_str(l):
@@ -25,16 +30,13 @@ def _parse_decklist_str(l):
         energy_check = c_set != 'Energy' and c_num not in th_helpers.utils.cards.ENERGY.values()
         c_set = c_set if energy_check else 'BRS'
         c_num = c_num if energy_check else c_split[2].replace('{', '').replace('}', '') if c_split[1] == 'Basic' else th_helpers.utils.cards.ENERGY[c_split[1]]
-        card = {
+        deck.append({
             'card_code': f'{c_set}-{c_num.zfill(3) if energy_check else c_num}',
             'set': c_set,
             'number': c_num,
             'name': ' '.join(c_split[1:-2]),
             'count': int(c_split[0]),
-        }
-        card = utils.cards.get_card(card)
-        if card is not None:
-            deck.append(card)
+        })
     return deck, unable_to_parse
 
 
@@ -48,16 +50,13 @@ def _parse_decklist_dict_list(l):
         energy_check = c_set != 'Energy' and c_num not in th_helpers.utils.cards.ENERGY.values()
         c_set = c_set if energy_check else 'BRS'
         c_num = c_num if energy_check else c_name[1].replace('{', '').replace('}', '') if c_name[0] == 'Basic' else th_helpers.utils.cards.ENERGY[c_name[0]]
-        card = {
+        deck.append({
             'card_code': f'{c_set}-{c_num.zfill(3) if energy_check else c_num}',
             'set': c_set,
             'number': c_num,
             'name': c['name'],
             'count': c['count'],
-        }
-        card = utils.cards.get_card(card)
-        if card is not None:
-            deck.append(card)
+        })
     return deck, unable_to_parse
 
 
@@ -68,28 +67,60 @@ def _hash_pokemon(card):
     return hashlib.sha256(combined).hexdigest()
 
 
-def parse_decklist(l):
-    deck = []
-    unable_to_parse = []
+def _card_unique(card):
+    card_supertype = card.get('supertype', None)
+    if not card_supertype:
+        return card['card_code']
+    elif card_supertype == 'Pokémon':
+        return _hash_pokemon(card)
+    elif card_supertype == 'Energy' or card_supertype == 'Trainer':
+        return card['name']
+    return None
+
+
+def _read_decklist(l):
     if not l:
-        return deck, unable_to_parse
+        return [], []
     if isinstance(l, str):
-        deck, unable_to_parse = _parse_decklist_str(l)
+        return _parse_decklist_str(l)
     elif isinstance(l, list) and isinstance(l[0], dict):
-        deck, unable_to_parse = _parse_decklist_dict_list(l)
-    else:
-        print('Warning: unable to parse this type of decklist', type(l))
-
-    for i, card in enumerate(deck):
-        card_supertype = card.get('supertype', None)
-        if not card_supertype:
-            unique = card['card_code']
-        elif card_supertype == 'Pokémon':
-            unique = _hash_pokemon(card)
-        elif card_supertype == 'Energy' or card_supertype == 'Trainer':
-            unique = card['name']
-        else:
-            unique = i
-        card['unique'] = unique
+        return _parse_decklist_dict_list(l)
+    print('Warning: unable to parse this type of decklist', type(l))
+    return [], []
 
-    return deck, unable_to_parse
+
+# Parse many decklists at once. Every card across the batch is looked up
+# in one `utils.cards.get_many` call, so comparing several lists costs
+# about the same as parsing one. Returns a (deck, unable_to_parse) pair
+# per decklist.
+# Nothing passes more than one list yet: each `DeckSelectAIO` parses its
+# own list in its own callback, so the Deck Diff pages and the prize
+# checker pay one lookup per list. They gain from the shared card caches
+# and the memoized `unique`s, not from batching.
+def parse_decklists(batch):
+    parsed = [_read_decklist(l) for l in batch]
+    identities = [utils.cards.card_identity(c) for deck, _ in parsed for c in deck]
+    fetched = utils.cards.get_many(identities)
+
+    results = []
+    for stubs, unable_to_parse in parsed:
+        deck = []
+        for stub in stubs:
+            fetched_card = fetched[utils.cards.card_identity(stub)]
+            if fetched_card is None:
+                continue
+            deck.append({**stub, **fetched_card})
+
+        for i, card in enumerate(deck):
+            unique = unique_cache.get(card['card_code'])
+            if unique is None:
+                unique = _card_unique(card)
+                if unique is not None:
+                    unique_cache.set(card['card_code'], unique)
+            card['unique'] = i if unique is None else unique
+        results.append((deck, unable_to_parse))
+    return results
+
+
+def parse_decklist(l):
+    return parse_decklists([l])[0]
@@ -0,0 +1,44 @@
+import builtins
+import collections
+import contextlib
+import time
+
+
+# Time every import statement run by a `prefix` module (the Dash pages by
+# default) and print the total per module on exit. A dependency is charged
+# to the first page that imports it, later pages find it in `sys.modules`,
+# which is the cost that matters when deciding what to import lazily.
+# Enable with `TH_IMPORT_REPORT=1`.
+@contextlib.contextmanager
+def profile_imports(enabled=True, prefix='pages.'):
+    costs = collections.Counter()
+    if not enabled:
+        yield costs
+        return
+
+    original_import = builtins.__import__
+    depth = 0
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        nonlocal depth
+        importer = (globals or {}).get('__name__', '')
+        if depth or not importer.startswith(prefix):
+            return original_import(name, globals, locals, fromlist, level)
+        depth += 1
+        start = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            depth -= 1
+            costs[importer] += time.perf_counter() - start
+
+    builtins.__import__ = timed_import
+    start = time.perf_counter()
+    try:
+        yield costs
+    finally:
+        builtins.__import__ = original_import
+        total = time.perf_counter() - start
+        print(f'Import cost per page ({total * 1000:.0f}ms total)')
+        for module, cost in costs.most_common():
+            print(f'  {cost * 1000:8.1f}ms  {module}')
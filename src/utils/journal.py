@@ -0,0 +1,174 @@
+import numpy as np
+import threading
+
+from utils import lru
+
+# Columnar copy of a Battle Journal's history for the analysis tab. Matches
+# and their games are stored as parallel numpy arrays, decks as codes into
+# `deck_ids` and game tags as bitmasks, so filters are array expressions and
+# matchups a single bincount. The journal is rebuilt only when the history
+# in the browser is not the journal's history plus new matches.
+
+RESULTS = ['Win', 'Loss', 'Tie']
+RESULT_CODES = {r: i for i, r in enumerate(RESULTS)}
+NO_RESULT = -1
+GAMES_PER_MATCH = 3
+# each uint64 word of a tag mask holds this many tags
+TAG_WORD = 64
+
+
+def _signature(match):
+    return match.get('time'), match.get('playing'), match.get('against'), match.get('result')
+
+
+def _turn(value):
+    try:
+        return int(value) if value else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class Journal:
+    def __init__(self):
+        self.signatures = []
+        self.deck_ids = []
+        self.deck_index = {}
+        self.tag_ids = []
+        self.tag_index = {}
+        # per match
+        self.playing = np.zeros(0, dtype=np.int32)
+        self.against = np.zeros(0, dtype=np.int32)
+        self.result = np.zeros(0, dtype=np.int8)
+        # per game, `game_match` is the position of the game's match
+        self.game_match = np.zeros(0, dtype=np.int32)
+        self.game_result = np.zeros(0, dtype=np.int8)
+        self.game_turn = np.zeros(0, dtype=np.int8)
+        self.game_tags = np.zeros((0, 1), dtype=np.uint64)
+        # match level W/L/T by (playing, against), kept up to date on append
+        self.counts = np.zeros((0, 0, 3), dtype=np.int32)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _deck(self, deck):
+        code = self.deck_index.get(deck)
+        if code is None:
+            code = self.deck_index[deck] = len(self.deck_ids)
+            self.deck_ids.append(deck)
+        return code
+
+    def _tag(self, tag):
+        bit = self.tag_index.get(tag)
+        if bit is None:
+            bit = self.tag_index[tag] = len(self.tag_ids)
+            self.tag_ids.append(tag)
+        return bit
+
+    def _mask(self, tags, words):
+        mask = np.zeros(words, dtype=np.uint64)
+        for tag in tags:
+            bit = self.tag_index.get(tag)
+            if bit is not None:
+                mask[bit // TAG_WORD] |= np.uint64(1) << np.uint64(bit % TAG_WORD)
+        return mask
+
+    def _extend(self, matches):
+        playing, against, result = [], [], []
+        game_match, game_result, game_turn, game_tags = [], [], [], []
+        first = len(self.signatures)
+        for i, m in enumerate(matches, first):
+            self.signatures.append(_signature(m))
+            playing.append(self._deck(m.get('playing')))
+            against.append(self._deck(m.get('against')))
+            result.append(RESULT_CODES.get(m.get('result'), NO_RESULT))
+            for g in range(GAMES_PER_MATCH):
+                game = m.get(f'game{g+1}') or {}
+                code = RESULT_CODES.get(game.get('result'), NO_RESULT)
+                if code == NO_RESULT:
+                    continue
+                game_match.append(i)
+                game_result.append(code)
+                game_turn.append(_turn(game.get('turn')))
+                game_tags.append([self._tag(t) for t in game.get('tags') or []])
+
+        words = max(1, -(-len(self.tag_ids) // TAG_WORD))
+        if words > self.game_tags.shape[1]:
+            self.game_tags = np.pad(self.game_tags, ((0, 0), (0, words - self.game_tags.shape[1])))
+        masks = np.zeros((len(game_tags), words), dtype=np.uint64)
+        for row, bits in enumerate(game_tags):
+            for bit in bits:
+                masks[row, bit // TAG_WORD] |= np.uint64(1) << np.uint64(bit % TAG_WORD)
+
+        playing = np.asarray(playing, dtype=np.int32)
+        against = np.asarray(against, dtype=np.int32)
+        result = np.asarray(result, dtype=np.int8)
+        self.playing = np.concatenate([self.playing, playing])
+        self.against = np.concatenate([self.against, against])
+        self.result = np.concatenate([self.result, result])
+        self.game_match = np.concatenate([self.game_match, np.asarray(game_match, dtype=np.int32)])
+        self.game_result = np.concatenate([self.game_result, np.asarray(game_result, dtype=np.int8)])
+        self.game_turn = np.concatenate([self.game_turn, np.asarray(game_turn, dtype=np.int8)])
+        self.game_tags = np.concatenate([self.game_tags, masks])
+
+        n = len(self.deck_ids)
+        if n > self.counts.shape[0]:
+            old = self.counts.shape[0]
+            self.counts = np.pad(self.counts, ((0, n - old), (0, n - old), (0, 0)))
+        self.counts += self._count(playing, against, result)
+
+    def _count(self, playing, against, result):
+        n = len(self.deck_ids)
+        counted = result != NO_RESULT
+        flat = (playing[counted] * n + against[counted]) * 3 + result[counted]
+        return np.bincount(flat, minlength=n * n * 3).astype(np.int32).reshape(n, n, 3)
+
+    # Bring the journal up to `matches`, appending when it starts with the
+    # matches already stored. Returns False when it does not.
+    def sync(self, matches):
+        with self._lock:
+            n = len(self.signatures)
+            if len(matches) < n or [_signature(m) for m in matches[:n]] != self.signatures:
+                return False
+            if len(matches) > n:
+                self._extend(matches[n:])
+            return True
+
+    # W/L/T by (playing, against) over matches, or over single games when
+    # `decompose` is set. Games can be filtered by the turn they went (0 for
+    # any) and by tags they must or must not have.
+    def matchup_counts(self, decompose=False, turn=0, included=(), excluded=()):
+        with self._lock:
+            if not decompose:
+                return list(self.deck_ids), self.counts.copy()
+            if any(t not in self.tag_index for t in included):
+                return list(self.deck_ids), np.zeros_like(self.counts)
+            keep = np.ones(len(self.game_match), dtype=bool)
+            if turn != 0:
+                keep &= self.game_turn == turn
+            words = self.game_tags.shape[1]
+            if included:
+                mask = self._mask(included, words)
+                keep &= np.all((self.game_tags & mask) == mask, axis=1)
+            if excluded:
+                mask = self._mask(excluded, words)
+                keep &= ~np.any(self.game_tags & mask, axis=1)
+            match = self.game_match[keep]
+            return list(self.deck_ids), self._count(self.playing[match], self.against[match], self.game_result[keep])
+
+
+# One journal per browser history, held in worker memory only and found by
+# the history's first match, which carries its creation time.
+journals = lru.LRUCache('battle_journals', maxsize=64)
+
+
+def get_journal(matches):
+    if len(matches) == 0:
+        return Journal()
+    anchor = _signature(matches[0])
+    journal = journals.get(anchor)
+    if journal is None or not journal.sync(matches):
+        journal = Journal()
+        journal.sync(matches)
+        journals.set(anchor, journal)
+    return journal
@@ -0,0 +1,85 @@
+import collections
+import functools
+import threading
+
+# every LRUCache by name, so their counters can be reported together
+caches = {}
+
+_MISSING = object()
+
+
+# Bounded by entry count and, when `maxbytes` is given, by the total of the
+# sizes passed to `set`.
+class LRUCache:
+    def __init__(self, name, maxsize, maxbytes=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._data = collections.OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=0):
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.bytes > self.maxbytes):
+                evicted, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self.bytes -= self._sizes.pop(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+# Memoize `f` in `cache` under `key(*args, **kwargs)`. Only for values the
+# callers treat as read-only, the same object is handed to every caller.
+def memoize(cache, key):
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            value = cache.get(k, _MISSING)
+            if value is _MISSING:
+                value = f(*args, **kwargs)
+                cache.set(k, value)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,75 @@
+import math
+import numpy as np
+
+RECORD_KEYS = {
+    'wins': ['wins', 'Win'],
+    'losses': ['losses', 'Loss'],
+    'ties': ['ties', 'Tie'],
+}
+
+
+def _sort_decks(decks):
+    if len(decks) > 0 and 'Plays:' in decks[0]:
+        return sorted(decks, key=lambda x: int(x.split(':')[1].strip()))
+    return sorted(decks)
+
+
+def _record_value(match, key):
+    for k in RECORD_KEYS[key]:
+        if k in match:
+            return match[k]
+    return 0
+
+
+# Pivot matchup records into a `player` by `against` deck matrix in one
+# pass. `cells` keeps the original record per pair (or `None`) for
+# rendering, the numeric arrays are for vectorized use. When a pair shows
+# up more than once the last record wins.
+def build_matrix(data, player='deck1', against='deck2'):
+    rows = _sort_decks(list(set(m[player] for m in data)))
+    columns = sorted(set(m[against] for m in data))
+    row_index = {d: i for i, d in enumerate(rows)}
+    column_index = {d: i for i, d in enumerate(columns)}
+
+    shape = (len(rows), len(columns))
+    cells = np.full(shape, None, dtype=object)
+    win_rate = np.full(shape, np.nan)
+    counts = {k: np.zeros(shape, dtype=int) for k in ['wins', 'losses', 'ties', 'total']}
+    for m in data:
+        i = row_index[m[player]]
+        j = column_index[m[against]]
+        cells[i, j] = m
+        wr = m.get('win_rate')
+        win_rate[i, j] = np.nan if wr is None or math.isnan(wr) else wr
+        for k in RECORD_KEYS:
+            counts[k][i, j] = _record_value(m, k)
+        counts['total'][i, j] = m.get('total', counts['wins'][i, j] + counts['losses'][i, j] + counts['ties'][i, j])
+
+    return {
+        'player': player,
+        'against': against,
+        'rows': rows,
+        'columns': columns,
+        'row_index': row_index,
+        'column_index': column_index,
+        'cells': cells,
+        'win_rate': win_rate,
+        **counts
+    }
+
+
+def to_frame(matrix):
+    import pandas as pd
+
+    i, j = np.nonzero(np.not_equal(matrix['cells'], None))
+    rows = np.array(matrix['rows'], dtype=object)
+    columns = np.array(matrix['columns'], dtype=object)
+    return pd.DataFrame({
+        matrix['player']: rows[i],
+        matrix['against']: columns[j],
+        'wins': matrix['wins'][i, j],
+        'losses': matrix['losses'][i, j],
+        'ties': matrix['ties'][i, j],
+        'total': matrix['total'][i, j],
+        'win_rate': matrix['win_rate'][i, j],
+    })
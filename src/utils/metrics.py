@@ -0,0 +1,298 @@
+import bisect
+import collections
+import fcntl
+import flask
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from utils import lru
+
+# Metrics are kept in each worker and written to a snapshot file per worker
+# in METRICS_DIR, a scrape can land on any worker so /metrics adds up every
+# snapshot. Counters and histograms of workers that have exited are folded
+# into an archive so totals do not drop when gunicorn recycles a worker,
+# their gauges are dropped. Series carry no worker label, the worker pids
+# change on every recycle.
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+METRICS_TOKEN = os.environ.get('TH_METRICS_TOKEN')
+METRICS_DIR = os.environ.get('TH_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'th-metrics'))
+# seconds between snapshots, a scrape sees the other workers this far behind
+FLUSH_INTERVAL = 10
+ARCHIVE = 'archive.pickle'
+
+_lock = threading.Lock()
+_help = {}
+_types = {}
+_merge = {}
+_counters = collections.defaultdict(float)
+_gauges = {}
+_histograms = {}
+_collectors = []
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+# `merge` is how a gauge is combined across workers, 'sum' for values each
+# worker holds its own share of, 'max' for values they all read from the
+# same place (or where the worst worker is the interesting one)
+def describe(name, kind, text, merge='sum'):
+    _types[name] = kind
+    _help[name] = text
+    _merge[name] = merge
+
+
+def inc(name, labels=None, value=1):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+# for totals this worker already counts elsewhere, like the LRU stats
+def set_counter(name, labels, value):
+    with _lock:
+        _counters[_key(name, labels)] = value
+
+
+def set_gauge(name, labels, value):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, labels, value, buckets=SECONDS_BUCKETS):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(buckets)
+        histogram.observe(value)
+
+
+# `collector()` runs on every scrape, for values that are cheaper to read
+# when asked for than to track as they change (cache sizes and the like)
+def register_collector(collector):
+    _collectors.append(collector)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'histograms': {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in _histograms.items()},
+        }
+
+
+def _write(path, snapshot):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def flush():
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            print(f'Error collecting metrics from {collector.__name__}: {e}')
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write(os.path.join(METRICS_DIR, f'{os.getpid()}.pickle'), _snapshot())
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _add(total, snapshot):
+    for key, value in snapshot['counters'].items():
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for key, (buckets, counts, sum_, count) in snapshot['histograms'].items():
+        if key not in total['histograms']:
+            total['histograms'][key] = (buckets, list(counts), sum_, count)
+            continue
+        _, total_counts, total_sum, total_count = total['histograms'][key]
+        merged = [a + b for a, b in zip(total_counts, counts)]
+        total['histograms'][key] = (buckets, merged, total_sum + sum_, total_count + count)
+
+
+def _empty():
+    return {'counters': {}, 'gauges': {}, 'histograms': {}}
+
+
+# Fold the snapshots of exited workers into the archive. The flock keeps
+# two workers scraping at once from folding the same snapshot twice.
+def _archive(pids):
+    with open(os.path.join(METRICS_DIR, 'archive.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        path = os.path.join(METRICS_DIR, ARCHIVE)
+        archive = _read(path) or _empty()
+        paths = [os.path.join(METRICS_DIR, f'{pid}.pickle') for pid in pids]
+        snapshots = [s for s in map(_read, paths) if s is not None]
+        if not snapshots:
+            return
+        for snapshot in snapshots:
+            _add(archive, snapshot)
+        _write(path, archive)
+        for p in paths:
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+
+
+def _collect():
+    flush()
+    live, dead = [], []
+    for filename in os.listdir(METRICS_DIR):
+        pid, ext = os.path.splitext(filename)
+        if ext == '.pickle' and pid.isdigit():
+            (live if _alive(int(pid)) else dead).append(int(pid))
+    if dead:
+        _archive(dead)
+
+    total = _read(os.path.join(METRICS_DIR, ARCHIVE)) or _empty()
+    total['gauges'] = {}
+    for pid in live:
+        snapshot = _read(os.path.join(METRICS_DIR, f'{pid}.pickle'))
+        if snapshot is None:
+            continue
+        _add(total, snapshot)
+        for key, value in snapshot['gauges'].items():
+            if key in total['gauges'] and _merge.get(key[0]) == 'max':
+                total['gauges'][key] = max(total['gauges'][key], value)
+            else:
+                total['gauges'][key] = total['gauges'].get(key, 0) + value
+    return total
+
+
+def render():
+    total = _collect()
+    series = collections.defaultdict(list)
+    for (name, labels), value in total['counters'].items():
+        series[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), value in total['gauges'].items():
+        series[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), (buckets, counts, sum_, count) in total['histograms'].items():
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            series[name].append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        series[name].append(f'{name}_sum{_format_labels(labels)} {_format_value(sum_)}')
+        series[name].append(f'{name}_count{_format_labels(labels)} {count}')
+
+    lines = []
+    for name in sorted(series):
+        if name in _help:
+            lines.append(f'# HELP {name} {_help[name]}')
+            lines.append(f'# TYPE {name} {_types[name]}')
+        lines.extend(sorted(series[name]))
+    return '\n'.join(lines) + '\n'
+
+
+# Write this worker's snapshot every FLUSH_INTERVAL, from gunicorn's
+# post_worker_init
+def start_flusher():
+    def loop():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                flush()
+            except Exception as e:
+                print(f'Error writing metrics snapshot: {e}')
+
+    threading.Thread(target=loop, name='th-metrics', daemon=True).start()
+
+
+# Drop the snapshots of a previous run, from gunicorn's on_starting, so a
+# reused pid does not pick up another process's numbers
+def clear_snapshots():
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for filename in os.listdir(METRICS_DIR):
+        try:
+            os.unlink(os.path.join(METRICS_DIR, filename))
+        except FileNotFoundError:
+            pass
+
+
+# With TH_METRICS_TOKEN set scrapes must send it as a bearer token,
+# without it only requests that did not come through the proxy (no
+# X-Forwarded-For) are answered. Caddy does not route /metrics either.
+def _allowed(request):
+    if METRICS_TOKEN:
+        return request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    return 'X-Forwarded-For' not in request.headers
+
+
+def init_app(server):
+    @server.get('/metrics')
+    def serve_metrics():
+        if not _allowed(flask.request):
+            flask.abort(404)
+        return flask.Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+describe('th_lru_hits_total', 'counter', 'Hits per in-process LRU cache.')
+describe('th_lru_misses_total', 'counter', 'Misses per in-process LRU cache.')
+describe('th_lru_evictions_total', 'counter', 'Evictions per in-process LRU cache.')
+describe('th_lru_entries', 'gauge', 'Entries held per in-process LRU cache.')
+describe('th_lru_bytes', 'gauge', 'Bytes held per size bounded LRU cache.')
+
+
+def _collect_lru():
+    for name, cache in list(lru.caches.items()):
+        stats = cache.stats()
+        labels = {'cache': name}
+        set_counter('th_lru_hits_total', labels, stats['hits'])
+        set_counter('th_lru_misses_total', labels, stats['misses'])
+        set_counter('th_lru_evictions_total', labels, stats['evictions'])
+        set_gauge('th_lru_entries', labels, stats['size'])
+        set_gauge('th_lru_bytes', labels, stats['bytes'])
+
+
+register_collector(_collect_lru)
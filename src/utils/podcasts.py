@@ -1,3 +1,4 @@
+import concurrent.futures
 import datetime
 import requests
 import xml.etree.ElementTree as ET
@@ -41,16 +42,20 @@ browserlike_headers = {
 }
 
 
-# cache for half an hour
-@cache.cache.memoize(timeout=3600)
-def download_rss_feed(url):
-    response = requests.get(url, headers=browserlike_headers)
-    # Check if the request was successful (status code 200)
-    if response.status_code == 200:
-        return response.text
-    else:
-        print(f"Error downloading RSS feed. Status Code: {response.status_code} {url}")
-        return None
+# seconds to wait on a single feed before giving up on it this round
+FEED_TIMEOUT = 5
+# validators and the last parsed episode per feed, kept for a week so a
+# cold episode cache can still send conditional requests
+FEED_STATE_TIMEOUT = 604800
+
+
+def download_rss_feed(url, etag=None, last_modified=None):
+    headers = browserlike_headers.copy()
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return requests.get(url, headers=headers, timeout=FEED_TIMEOUT)
 
 
 def get_link(item):
@@ -96,15 +101,52 @@ def parse_rss_feed_for_first_item(xml_content):
                     'published': published_date, 'image': image}
 
 
+def _feed_state_key(url):
+    return f'podcasts.feed.{url}'
+
+
+# runs on the feed pool without an app context, so it only takes and
+# returns the feed state and leaves reading/writing the cache to the caller
+def fetch_feed_state(title, url, state):
+    try:
+        response = download_rss_feed(url, state.get('etag'), state.get('last_modified'))
+    except requests.RequestException as e:
+        print(f'Error downloading RSS feed. {e} {url}')
+        return state
+    if response.status_code == 304:
+        return state
+    if response.status_code != 200:
+        print(f"Error downloading RSS feed. Status Code: {response.status_code} {url}")
+        return state
+
+    try:
+        first = parse_rss_feed_for_first_item(response.text)
+    except ET.ParseError as e:
+        print(f'Error parsing RSS feed. {e} {url}')
+        return state
+    if first is not None:
+        first['podcast_title'] = title
+        first['link'] = first['link'] if first['link'] is not None else BACKUP[title]
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'episode': first
+    }
+
+
+# fresh for an hour, then served stale while refreshing for up to a day
+@cache.memoize_swr(timeout=3600, stale_for=86400)
 def fetch_latest_episodes():
-    episodes = []
-    for key in FEEDS:
-        rss_feed_url = FEEDS[key]
-        xml_content = download_rss_feed(rss_feed_url)
-        if xml_content:
-            first = parse_rss_feed_for_first_item(xml_content)
-            first['podcast_title'] = key
-            first['link'] = first['link'] if first['link'] is not None else BACKUP[first['podcast_title']]
-            episodes.append(first)
+    state_keys = [_feed_state_key(url) for url in FEEDS.values()]
+    states = cache.cache.get_many(*state_keys)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(FEEDS)) as pool:
+        futures = [
+            pool.submit(fetch_feed_state, title, url, state or {})
+            for (title, url), state in zip(FEEDS.items(), states)
+        ]
+        states = [f.result() for f in futures]
+    cache.cache.set_many({k: s for k, s in zip(state_keys, states) if s}, timeout=FEED_STATE_TIMEOUT)
+
+    episodes = [s['episode'] for s in states if s and s.get('episode')]
     episodes = sorted(episodes, key=lambda x: x['published'], reverse=True)
     return episodes
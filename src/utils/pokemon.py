@@ -1,3 +1,5 @@
+import bisect
+
 pokemon = [
     'abomasnow-mega',
     'abomasnow',
@@ -1218,3 +1220,39 @@ pokemon_as_decks = [{
     'id': p,
     'icons': [p]
 } for p in pokemon]
+
+pokemon_by_id = {d['id']: d for d in pokemon_as_decks}
+
+SEARCH_PAGE_SIZE = 50
+
+
+def _normalize(text):
+    return ' '.join(text.lower().replace('-', ' ').split())
+
+
+# Sorted (key, id) pairs where the keys are the full name and every tail of
+# it starting at a word, so "mega" finds "Charizard Mega X". A prefix query
+# is then a bisect to the first match and a scan while keys still match.
+search_index = sorted(
+    (' '.join(words[i:]), d['id'])
+    for d in pokemon_as_decks
+    for words in [_normalize(d['name']).split()]
+    for i in range(len(words))
+)
+_search_keys = [key for key, _ in search_index]
+
+
+# Pokémon whose name, or any word in it, starts with `prefix`, as decks. The
+# dropdown has no way to ask for a next page, past `limit` matches the user
+# types more of the name instead.
+def search(prefix, limit=SEARCH_PAGE_SIZE):
+    prefix = _normalize(prefix)
+    if not prefix:
+        return []
+    ids = {}
+    for i in range(bisect.bisect_left(_search_keys, prefix), len(search_index)):
+        key, id = search_index[i]
+        if not key.startswith(prefix) or len(ids) >= limit:
+            break
+        ids[id] = True
+    return [pokemon_by_id[id] for id in ids]
@@ -0,0 +1,108 @@
+import cProfile
+import collections
+import flask
+import io
+import os
+import pstats
+import threading
+import time
+
+from utils import metrics
+
+CALLBACK_PATH = '_dash-update-component'
+# recent durations kept per callback for the rolling percentiles
+WINDOW = 500
+QUANTILES = (0.5, 0.95, 0.99)
+# requests carrying this header with the value of TH_PROFILE_TOKEN get
+# profiled, the top of the profile is printed to the worker log
+PROFILE_HEADER = 'X-TH-Profile'
+PROFILE_TOKEN = os.environ.get('TH_PROFILE_TOKEN')
+PROFILE_LINES = 30
+
+metrics.describe('th_callback_seconds', 'histogram', 'Wall time per Dash callback.')
+metrics.describe('th_callback_upstream_seconds', 'histogram', 'Time a Dash callback spent waiting on the upstream API.')
+metrics.describe('th_callback_build_seconds', 'histogram', 'Time a Dash callback spent outside upstream calls, building and serializing.')
+metrics.describe('th_callback_response_bytes', 'histogram', 'Serialized, uncompressed output size per Dash callback.')
+metrics.describe('th_callback_recent_seconds', 'gauge', f'Wall time percentiles over the last {WINDOW} calls per Dash callback, from the slowest worker.', merge='max')
+
+_recent = collections.defaultdict(lambda: collections.deque(maxlen=WINDOW))
+_recent_lock = threading.Lock()
+# cProfile hooks the whole thread, only profile one request at a time
+_profile_lock = threading.Lock()
+
+
+# Called by the upstream helpers so the time a request spends waiting on
+# the API can be told apart from our own rendering.
+def add_upstream_time(seconds):
+    if flask.has_request_context():
+        flask.g.th_upstream_seconds = flask.g.get('th_upstream_seconds', 0) + seconds
+
+
+def _callback_id():
+    body = flask.request.get_json(silent=True) or {}
+    return body.get('output', 'unknown')
+
+
+def _start():
+    if not flask.request.path.endswith(CALLBACK_PATH):
+        return
+    flask.g.th_callback_start = time.perf_counter()
+    flask.g.th_upstream_seconds = 0
+    if PROFILE_TOKEN and flask.request.headers.get(PROFILE_HEADER) == PROFILE_TOKEN and _profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        flask.g.th_profiler = profiler
+        profiler.enable()
+
+
+def _finish(response):
+    start = flask.g.pop('th_callback_start', None)
+    if start is None:
+        return response
+    wall = time.perf_counter() - start
+    upstream = flask.g.pop('th_upstream_seconds', 0)
+    callback = _callback_id()
+    labels = {'callback': callback}
+    metrics.observe('th_callback_seconds', labels, wall)
+    metrics.observe('th_callback_upstream_seconds', labels, upstream)
+    metrics.observe('th_callback_build_seconds', labels, max(wall - upstream, 0))
+    if not response.direct_passthrough:
+        size = response.calculate_content_length() or 0
+        metrics.observe('th_callback_response_bytes', labels, size, buckets=metrics.BYTES_BUCKETS)
+    with _recent_lock:
+        _recent[callback].append(wall)
+
+    profiler = flask.g.pop('th_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        print(f'Profile for {callback} ({wall * 1000:.0f}ms, {upstream * 1000:.0f}ms upstream)\n{out.getvalue()}')
+    return response
+
+
+# after_request is skipped when a request dies outright, do not leave the
+# profiler running or the lock held
+def _teardown(exc):
+    profiler = flask.g.pop('th_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+
+
+def _collect_percentiles():
+    with _recent_lock:
+        recent = {callback: sorted(durations) for callback, durations in _recent.items()}
+    for callback, durations in recent.items():
+        for q in QUANTILES:
+            value = durations[min(int(q * len(durations)), len(durations) - 1)]
+            metrics.set_gauge('th_callback_recent_seconds', {'callback': callback, 'quantile': q}, value)
+
+
+# Time every Dash callback request. Register after `utils.responses` so the
+# size recorded is the body before compression.
+def init_app(server):
+    server.before_request(_start)
+    server.after_request(_finish)
+    server.teardown_request(_teardown)
+    metrics.register_collector(_collect_percentiles)
@@ -0,0 +1,82 @@
+import flask
+import gzip
+import hashlib
+
+from utils import lru
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Dash's JSON endpoints, these carry the large layout and callback payloads
+DASH_ENDPOINTS = ('_dash-layout', '_dash-dependencies', '_dash-update-component')
+# compressing tiny bodies costs more than it saves
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# compressed bodies by (body hash, encoding), the same matchup or breakdown
+# payload is only compressed once no matter how many users request it
+compressed_bodies = lru.LRUCache('compressed_responses', maxsize=256)
+
+
+def _encoding(accept_encoding):
+    accepted = {e.split(';')[0].strip() for e in accept_encoding.split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def _compressed_body(digest, body, encoding):
+    key = (digest, encoding)
+    compressed = compressed_bodies.get(key)
+    if compressed is None:
+        compressed = _compress(body, encoding)
+        compressed_bodies.set(key, compressed)
+    return compressed
+
+
+def finalize_response(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or not flask.request.path.endswith(DASH_ENDPOINTS)
+    ):
+        return response
+
+    body = response.get_data()
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    # weak, the validator covers the payload whatever encoding it is sent in
+    response.set_etag(digest, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+
+    if flask.request.if_none_match.contains_weak(digest):
+        response.status_code = 304
+        response.set_data(b'')
+        response.headers.pop('Content-Type', None)
+        return response
+
+    encoding = _encoding(flask.request.headers.get('Accept-Encoding', ''))
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(_compressed_body(digest, body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# Hash Dash payloads into ETags, answer conditional requests with a 304 and
+# send cached compressed bodies, the proxy passes pre-encoded responses
+# through untouched.
+def init_app(server):
+    server.after_request(finalize_response)
@@ -0,0 +1,120 @@
+import collections
+import io
+import xml.etree.ElementTree as ET
+
+# Streaming reader for TOM's .tdf tournament exports. The file is walked
+# once with `iterparse`, elements are cleared as soon as their record is
+# emitted so memory stays flat no matter how large the event is.
+
+# match outcomes as TOM writes them
+OUTCOME_P1_WIN = 1
+OUTCOME_P2_WIN = 2
+OUTCOME_TIE = 3
+OUTCOME_BYE = 5
+OUTCOME_LATE = 8
+
+Player = collections.namedtuple('Player', ['userid', 'firstname', 'lastname', 'birthdate'])
+Pod = collections.namedtuple('Pod', ['category', 'stage'])
+Round = collections.namedtuple('Round', ['category', 'number', 'type', 'stage'])
+# `player2` is `None` for single player matches (byes, late to round 1)
+Match = collections.namedtuple('Match', ['category', 'round', 'outcome', 'player1', 'player2', 'table'])
+Standing = collections.namedtuple('Standing', ['category', 'type', 'userid', 'place'])
+Tournament = collections.namedtuple('Tournament', ['info', 'players', 'pods', 'rounds', 'matches', 'standings'])
+
+_RECORD_TAGS = {'data', 'player', 'pod', 'round', 'match'}
+
+
+def _int(value, default=None):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _text(elem, tag):
+    child = elem.find(tag)
+    if child is None or child.text is None:
+        return ''
+    return child.text.strip()
+
+
+# Yield `Player`, `Pod`, `Round`, `Match` and `Standing` records, plus a
+# single `dict` of the tournament's `<data>` block. Only end events are
+# read, a pod's category is on its closing tag's attributes so rounds and
+# matches are held until their pod closes and come out pod by pod.
+# `source` is a path or a binary file object.
+def iter_records(source):
+    round_matches = []
+    pod_rounds = []
+    pod_matches = []
+    standings = []
+    for _, elem in ET.iterparse(source):
+        tag = elem.tag
+        if tag not in _RECORD_TAGS:
+            continue
+        if tag == 'match':
+            player1 = elem.find('player1')
+            if player1 is None:
+                player1 = elem.find('player')
+            player2 = elem.find('player2')
+            round_matches.append((
+                _int(elem.get('outcome'), 0),
+                player1.get('userid') if player1 is not None else None,
+                player2.get('userid') if player2 is not None else None,
+                _int(_text(elem, 'tablenumber'))
+            ))
+            elem.clear()
+        elif tag == 'player':
+            if 'id' in elem.attrib:
+                standings.append((elem.get('id'), _int(elem.get('place'))))
+            elif elem.find('firstname') is not None:
+                yield Player(elem.get('userid'), _text(elem, 'firstname'), _text(elem, 'lastname'), _text(elem, 'birthdate'))
+                elem.clear()
+            # a bye's `<player>` is read with its match
+        elif tag == 'round':
+            number = _int(elem.get('number'))
+            pod_rounds.append((number, _int(elem.get('type')), _int(elem.get('stage'))))
+            pod_matches.extend((number, *m) for m in round_matches)
+            round_matches = []
+            elem.clear()
+        elif tag == 'pod':
+            category = _int(elem.get('category'))
+            if 'type' in elem.attrib:
+                pod_type = elem.get('type')
+                for userid, place in standings:
+                    yield Standing(category, pod_type, userid, place)
+                standings = []
+            else:
+                yield Pod(category, _int(elem.get('stage')))
+                for r in pod_rounds:
+                    yield Round(category, *r)
+                for m in pod_matches:
+                    yield Match(category, *m)
+                pod_rounds = []
+                pod_matches = []
+            elem.clear()
+        elif tag == 'data':
+            info = {child.tag: (child.text or '').strip() for child in elem}
+            organizer = elem.find('organizer')
+            if organizer is not None:
+                info['organizer'] = organizer.get('name', '')
+                info['organizer_popid'] = organizer.get('popid', '')
+            yield info
+            elem.clear()
+
+
+# Read a whole tournament into flat lists of records, `source` is a path,
+# a binary file object or the raw bytes of the file.
+def parse(source):
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    info = {}
+    players, pods, rounds, matches, standings = [], [], [], [], []
+    by_type = {Player: players, Pod: pods, Round: rounds, Match: matches, Standing: standings}
+    for record in iter_records(source):
+        if isinstance(record, dict):
+            info = record
+        else:
+            by_type[type(record)].append(record)
+    return Tournament(info, players, pods, rounds, matches, standings)
+
@@ -0,0 +1,240 @@
+import functools
+import hashlib
+import numpy as np
+import threading
+import time
+
+import utils.cache
+import utils.tdf
+from utils import lru
+
+# Everything the Tournament Meta Report needs from an upload, indexed once
+# when the file is read. Players are referred to by their position in
+# `player_ids`, matches are parallel arrays of those positions.
+
+# uploads are kept server side, the browser only holds the key
+TIMEOUT = 86400
+KEY_PREFIX = 'tournament/'
+
+NO_PLAYER = -1
+# deck of players the roster has not assigned one
+DEFAULT_DECK = 'other'
+# record columns
+WINS, LOSSES, TIES = 0, 1, 2
+
+
+def _column_lookup(columns):
+    lookup = np.full(256, -1, dtype=np.int8)
+    for outcome, column in columns.items():
+        lookup[outcome] = column
+    return lookup
+
+
+# record column by match outcome from each side of the table, -1 for
+# outcomes that do not count (double game losses and the like)
+_P1_COLUMN = _column_lookup({
+    utils.tdf.OUTCOME_P1_WIN: WINS,
+    utils.tdf.OUTCOME_P2_WIN: LOSSES,
+    utils.tdf.OUTCOME_TIE: TIES,
+    utils.tdf.OUTCOME_BYE: WINS,
+    utils.tdf.OUTCOME_LATE: LOSSES,
+})
+_P2_COLUMN = _column_lookup({
+    utils.tdf.OUTCOME_P1_WIN: LOSSES,
+    utils.tdf.OUTCOME_P2_WIN: WINS,
+    utils.tdf.OUTCOME_TIE: TIES,
+})
+
+
+# flat (rows * 3) W/L/T counts of `columns` per row
+def _count(rows, columns, n_rows):
+    counted = columns >= 0
+    return np.bincount(rows[counted] * 3 + columns[counted], minlength=n_rows * 3).astype(np.int32)
+
+
+class TournamentModel:
+    def __init__(self, info, player_ids, names, places, categories, standings, p1, p2, outcome):
+        self.info = info
+        self.player_ids = player_ids
+        self.player_index = {pid: i for i, pid in enumerate(player_ids)}
+        # (firstname, lastname) per player
+        self.names = names
+        # finishing place per player, 0 when they have no finished standing
+        self.places = np.asarray(places, dtype=np.int32)
+        # division (pod category) per player
+        self.categories = np.asarray(categories, dtype=np.int8)
+        # {category: [player index, ...]} in finishing order, finished pods only
+        self.standings = standings
+        self.p1 = np.asarray(p1, dtype=np.int32)
+        # `NO_PLAYER` for byes and late to round 1
+        self.p2 = np.asarray(p2, dtype=np.int32)
+        self.outcome = np.asarray(outcome, dtype=np.uint8)
+        self.records = self._records()
+
+    @classmethod
+    def from_tdf(cls, tournament):
+        player_ids = [p.userid for p in tournament.players]
+        index = {pid: i for i, pid in enumerate(player_ids)}
+        names = [(p.firstname, p.lastname) for p in tournament.players]
+        # players who never made it into a standings pod keep the division
+        # they were paired in
+        categories = [0] * len(player_ids)
+        for m in tournament.matches:
+            for pid in (m.player1, m.player2):
+                if pid in index:
+                    categories[index[pid]] = m.category
+        places = [0] * len(player_ids)
+        standings = {}
+        for s in tournament.standings:
+            i = index.get(s.userid)
+            if i is None:
+                continue
+            categories[i] = s.category
+            if s.type == 'finished':
+                places[i] = s.place
+                standings.setdefault(s.category, []).append(i)
+
+        matches = [m for m in tournament.matches if m.player1 in index]
+        p1 = [index[m.player1] for m in matches]
+        p2 = [index.get(m.player2, NO_PLAYER) for m in matches]
+        outcome = [m.outcome if 0 <= m.outcome < 256 else 0 for m in matches]
+        return cls(tournament.info, player_ids, names, places, categories, standings, p1, p2, outcome)
+
+    def _records(self):
+        n = len(self.player_ids)
+        counts = _count(self.p1, _P1_COLUMN[self.outcome], n)
+        paired = self.p2 != NO_PLAYER
+        counts += _count(self.p2[paired], _P2_COLUMN[self.outcome[paired]], n)
+        return counts.reshape(n, 3)
+
+    def record(self, i):
+        wins, losses, ties = self.records[i]
+        return f'{wins}-{losses}-{ties}'
+
+    # paired matches as (player1, player2, outcome) arrays
+    @functools.cached_property
+    def paired(self):
+        paired = self.p2 != NO_PLAYER
+        return self.p1[paired], self.p2[paired], self.outcome[paired]
+
+    # for each player the positions in `paired` of the matches they played,
+    # as CSR style (positions, offsets) arrays
+    @functools.cached_property
+    def incidence(self):
+        p1, p2, _ = self.paired
+        players = np.concatenate([p1, p2])
+        matches = np.tile(np.arange(len(p1), dtype=np.int32), 2)
+        order = np.argsort(players, kind='stable')
+        offsets = np.searchsorted(players[order], np.arange(len(self.player_ids) + 1))
+        return matches[order], offsets
+
+    def player_matches(self, players):
+        positions, offsets = self.incidence
+        return np.unique(np.concatenate([positions[offsets[i]:offsets[i + 1]] for i in players]))
+
+    # W/L/T counts as a (decks, decks, 3) array, `[i, j]` is deck `i`
+    # playing against deck `j`. `deck_of` maps player index to deck index,
+    # `matches` limits the count to those positions in `paired`.
+    def matchup_counts(self, deck_of, n_decks, matches=None):
+        p1, p2, outcome = self.paired
+        if matches is not None:
+            p1, p2, outcome = p1[matches], p2[matches], outcome[matches]
+        d1 = deck_of[p1]
+        d2 = deck_of[p2]
+        counts = _count(d1 * n_decks + d2, _P1_COLUMN[outcome], n_decks * n_decks)
+        counts += _count(d2 * n_decks + d1, _P2_COLUMN[outcome], n_decks * n_decks)
+        return counts.reshape(n_decks, n_decks, 3)
+
+
+# Deck by deck W/L/T for one tournament under a changing roster. Each
+# update diffs the roster against the last one seen and only recounts the
+# matches of players whose deck changed.
+class MatchupAggregate:
+    # past this share of changed players a full recount is cheaper
+    FULL_RECOUNT = 0.25
+
+    def __init__(self, model):
+        self.model = model
+        self.deck_ids = [DEFAULT_DECK]
+        self.deck_index = {DEFAULT_DECK: 0}
+        self.deck_of = np.zeros(len(model.player_ids), dtype=np.int32)
+        self.counts = model.matchup_counts(self.deck_of, 1)
+        self._lock = threading.Lock()
+
+    def _add_decks(self, decks):
+        new = [d for d in decks if d not in self.deck_index]
+        if not new:
+            return
+        for d in new:
+            self.deck_index[d] = len(self.deck_ids)
+            self.deck_ids.append(d)
+        n = len(self.deck_ids)
+        counts = np.zeros((n, n, 3), dtype=self.counts.dtype)
+        old = self.counts.shape[0]
+        counts[:old, :old] = self.counts
+        self.counts = counts
+
+    # `roster` maps player id to deck id, missing players play `DEFAULT_DECK`.
+    # Returns (deck ids, (decks, decks, 3) W/L/T counts, players per deck).
+    def update(self, roster):
+        with self._lock:
+            self._add_decks(set(roster.values()))
+            n_decks = len(self.deck_ids)
+            deck_of = np.fromiter(
+                (self.deck_index[roster.get(p_id, DEFAULT_DECK)] for p_id in self.model.player_ids),
+                dtype=np.int32, count=len(self.model.player_ids)
+            )
+            changed = np.flatnonzero(deck_of != self.deck_of)
+            if len(changed) > self.FULL_RECOUNT * len(deck_of):
+                self.counts = self.model.matchup_counts(deck_of, n_decks)
+            elif len(changed) > 0:
+                matches = self.model.player_matches(changed)
+                self.counts -= self.model.matchup_counts(self.deck_of, n_decks, matches)
+                self.counts += self.model.matchup_counts(deck_of, n_decks, matches)
+            self.deck_of = deck_of
+            return list(self.deck_ids), self.counts.copy(), np.bincount(deck_of, minlength=n_decks)
+
+
+# Models are immutable and keyed by the file's content so every worker can
+# keep the unpickled object around. Sessions uploading the same file share
+# the entry, so nothing deletes it early, it is stored with its expiry and
+# every copy, shared or worker local, is dropped once that has passed.
+models = lru.LRUCache('tournament_models', maxsize=16)
+
+
+def content_key(raw):
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def save(key, model):
+    entry = (time.time() + TIMEOUT, model)
+    utils.cache.cache.set(KEY_PREFIX + key, entry, timeout=TIMEOUT)
+    models.set(key, entry)
+
+
+def load(key):
+    entry = models.get(key)
+    if entry is None:
+        entry = utils.cache.cache.get(KEY_PREFIX + key)
+        if entry is None:
+            return None
+        models.set(key, entry)
+    expires, model = entry
+    if expires < time.time():
+        models.delete(key)
+        aggregates.delete(key)
+        return None
+    return model
+
+
+# one running aggregate per tournament, rosters of the same upload diff
+# against whichever roster was counted last
+aggregates = lru.LRUCache('tournament_matchups', maxsize=16)
+
+
+def get_aggregate(key, model):
+    aggregate = aggregates.get(key)
+    if aggregate is None or aggregate.model is not model:
+        aggregate = MatchupAggregate(model)
+        aggregates.set(key, aggregate)
+    return aggregate
@@ -0,0 +1,120 @@
+import importlib
+import threading
+import time
+
+from components import tour_filter
+import utils.cache
+import utils.data
+import utils.date
+import utils.podcasts
+
+GAMES = ['PTCG', 'POCKET']
+# how many of the most played archetypes get their decklist page warmed
+TOP_DECKLISTS = 5
+# re-run well inside the half day timeout of the data fetchers
+WARM_INTERVAL = 6 * 3600
+# how often each worker checks whether it is its turn to warm
+CHECK_INTERVAL = 300
+START_DELAY = 30
+LOCK_KEY = 'warmer.lock'
+# longer than a warm takes, only matters if the worker dies holding it
+LOCK_TIMEOUT = 1800
+WARMED_KEY = 'warmer.warmed'
+
+
+def _warm_home(game):
+    home_filters = {'start_date': utils.date.weeks_ago_3(), 'game': game}
+    deck_data = utils.data.get_decks.refresh(home_filters)
+    archetypes = {d['id']: d for d in deck_data[:6] if d['id'] != 'other'}
+    utils.data.fetch_matchup_data(home_filters, archetypes.keys())
+
+
+def _decklist_filters(tf, deck):
+    # mirror the query string the meta and deck select pages link with
+    filters = tour_filter.create_tour_filter(
+        players=str(tf['players']), start_date=tf['start_date'],
+        end_date=tf['end_date'], game=tf['game']
+    )
+    filters['deck'] = deck
+    filters['placement'] = 0.5
+    filters['include'] = None
+    filters['exclude'] = None
+    filters['granularity'] = 0.6
+    filters['selected_card'] = None
+    return filters
+
+
+# Fill the page functions' own memoized entries as well as the session
+# cache, a cold visitor then skips both the API call and the rendering.
+def _warm_meta(game):
+    # Dash loads the pages itself, take the modules it registered
+    meta = importlib.import_module('pages.meta')
+    decklist = importlib.import_module('pages.decklist_new')
+
+    tf = tour_filter.create_tour_filter(game=game)
+    decks = utils.data.get_decks.refresh(tf)
+    selected = [d['id'] for d in decks[:15] if d['id'] != 'other']
+    matchup_filters = tf.copy()
+    matchup_filters['placement'] = 10_000
+    utils.data.fetch_matchup_data(matchup_filters, selected)
+
+    meta.fetch_breakdown_data(tf)
+    meta.fetch_breakdown_data(tf, 8)
+
+    requests = {}
+    for deck in selected[:TOP_DECKLISTS]:
+        filters = _decklist_filters(tf, deck)
+        deck_options = utils.data.get_decks.refresh(filters)
+        against = utils.data.default_against_archetypes(deck_options, deck)
+        decklist.update_card_dropdown_options(filters)
+        requests[f'{deck}-skeleton'] = utils.data.skeleton_request(filters)
+        requests[f'{deck}-matchups'] = utils.data.card_matchups_request(filters, against)
+    utils.data.fetch_many(requests, refresh=True)
+
+
+def warm():
+    start = time.monotonic()
+    with utils.cache.refreshing():
+        for game in GAMES:
+            _warm_home(game)
+            _warm_meta(game)
+    utils.podcasts.fetch_latest_episodes.refresh()
+    print(f'Cache warmed in {time.monotonic() - start:.1f}s')
+
+
+# Warm unless another worker did within the interval. The marker is checked
+# and set under a worker lock, so only one worker warms per interval.
+def _warm_if_due():
+    lock = utils.cache.worker_lock(LOCK_KEY, LOCK_TIMEOUT)
+    if not lock.acquire():
+        return
+    try:
+        if utils.cache.cache.get(WARMED_KEY) is not None:
+            return
+        # marked up front so a failing warm waits for the next interval too
+        utils.cache.cache.set(WARMED_KEY, True, timeout=WARM_INTERVAL)
+        warm()
+        utils.data.purge_session_cache()
+    finally:
+        lock.release()
+
+
+# Every worker runs the loop, see `_warm_if_due`.
+def start(app):
+    def run():
+        time.sleep(START_DELAY)
+        while True:
+            with app.app_context():
+                try:
+                    _warm_if_due()
+                except Exception as e:
+                    print(f'Error warming cache: {e}')
+            time.sleep(CHECK_INTERVAL)
+    threading.Thread(target=run, daemon=True, name='th-cache-warmer').start()
+
+
+if __name__ == '__main__':
+    # the page modules register themselves with the Dash app on import
+    import app
+    with app.server.app_context():
+        warm()